@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+
+""" Benchmarks of the hot paths of drawing and editing. They run without a display on the Qt offscreen platform and
+with synthetic data, so no server is contacted and the cache of Osmapy is not touched. The results are printed as JSON
+to compare them across versions:
+
+    python -m osmapy.Benchmark.Benchmark --output results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import queue
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # must be set before the application is created
+
+import PySide2
+from PySide2.QtGui import QImage, QPainter
+from PySide2.QtWidgets import QApplication, QMainWindow
+
+from osmapy.Changeset.Changeset import Changeset
+from osmapy.ElementsLoader.ElementsLoader import ElementsLoader
+from osmapy.ElementsLoader.Node import Node
+from osmapy.GPXLoader.GPXLoader import GPXLoader
+from osmapy.TileLoader.TileLoader import TileLoader
+from osmapy.Viewer.ElementViewer import ElementViewer
+from osmapy.Viewer.LayerManager import LayerManager
+from osmapy.Viewer.Viewer import Viewer
+from osmapy.utils import calc
+from osmapy.utils.config import config
+
+LAT, LON, ZOOM = 50.0, 8.0, 17  # center of the view
+WIDTH, HEIGHT = 1280, 800  # size of the view in pixels
+
+
+class SyntheticTileLoader(TileLoader):
+    """ TileLoader which renders plain colored tiles instead of downloading them.
+    """
+
+    def __init__(self, viewer, name, path_cache):
+        """
+        Args:
+            viewer (Viewer): viewer object where the slippy tile should be shown
+            name (str): name of the layer
+            path_cache (pathlib.Path): folder of the cached tiles
+        """
+        self.name = name
+        self.urls = []
+        self.max_zoom = 19
+        self.show_error_tiles = True
+
+        self.start(viewer, path_cache)
+
+    def fetch(self, tile):
+        """ Render a plain tile with a color depending on the tile number.
+
+        Args:
+            tile (Tile): tile object of the tile which should be rendered.
+
+        Returns:
+            bytes: PNG image of the tile
+        """
+        from PIL import Image
+
+        color = (tile.int_xtile * 37 % 256, tile.int_ytile * 59 % 256, tile.zoom * 13 % 256)
+        buffer = BytesIO()
+        Image.new("RGB", (config.image_size, config.image_size), color).save(buffer, "PNG")
+        return buffer.getvalue()
+
+    def warm(self, viewer):
+        """ Request the tiles of a view and wait until all of them are saved.
+
+        Args:
+            viewer (Viewer): view which draws the tiles
+        """
+        draw_layer(self, viewer)
+        self.queue.join()
+
+    def clear(self):
+        """ Remove all tiles from the caches, so the next frame is drawn with a cold cache.
+        """
+        with self.lock:
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                self.queue.task_done()
+        self.queue.join()  # wait for the tiles which are rendered right now
+        self.forget_images()
+        with self.lock:
+            self.cache_json.clear()
+            self.missing.clear()
+            for path in self.path_cache.glob("*.png"):
+                path.unlink()
+
+    def forget_images(self):
+        """ Remove all decoded tiles from the memory cache, so the next frame is drawn from the disk cache.
+        """
+        self.decoder.shutdown(wait=True)  # wait for the tiles which are decoded right now
+        self.decoder = ThreadPoolExecutor(max_workers=2)
+        with self.lock:
+            self.decoding.clear()
+            self.images.clear()
+
+
+class BenchmarkWindow(QMainWindow):
+    """ Main window with the widgets the Viewer depends on, but with the data in a temporary folder and without the
+    configured tile servers.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (pathlib.Path): temporary folder for the caches
+        """
+        super(BenchmarkWindow, self).__init__()
+        self.path = path
+        self.elements_loader = ElementsLoader(path / "elements")
+        self.element_viewer = ElementViewer(self)
+        self.layer_manager = LayerManager(self)
+
+        self.viewer = Viewer(self)
+        self.setCentralWidget(self.viewer)
+        self.viewer.resize(WIDTH, HEIGHT)
+        self.viewer.zoom = ZOOM
+        self.viewer.set_deg(LAT, LON)
+
+    def add_tile_layers(self, number):
+        """ Add synthetic tile layers to the viewer.
+
+        Args:
+            number (int): number of layers
+
+        Returns:
+            [SyntheticTileLoader]: the new layers
+        """
+        tile_loaders = []
+        for _ in range(number):
+            name = f"Tiles {len(self.viewer.tile_loaders)}"
+            tile_loader = SyntheticTileLoader(self.viewer, name, self.path / name)
+            self.viewer.tile_loaders.append(tile_loader)
+            self.layer_manager.add_layer(tile_loader, name)
+            tile_loaders.append(tile_loader)
+        return tile_loaders
+
+    def close_loaders(self):
+        """ Close the loaders, e.g. to release the element store before the temporary folder is removed.
+        """
+        self.elements_loader.close()
+
+
+def view_bbox():
+    """ Bounding box of the benchmark view.
+
+    Returns:
+        (float, float, float, float): west, south, east and north in degree
+    """
+    tile_width = 360 / 2 ** ZOOM
+    west, east = LON - WIDTH / 2 / config.image_size * tile_width, LON + WIDTH / 2 / config.image_size * tile_width
+    x, y = calc.deg2xy(LAT, LON)
+    height = HEIGHT / 2 / config.image_size * tile_width
+    south, _ = calc.xy2deg(x, y - height)
+    north, _ = calc.xy2deg(x, y + height)
+    return west, south, east, north
+
+
+def synthetic_nodes(number, rng):
+    """ Create raw nodes with random positions in the view.
+
+    Args:
+        number (int): number of nodes
+        rng (random.Random): random number generator
+
+    Returns:
+        [dict]: raw nodes in the format of the OSM server answer
+    """
+    west, south, east, north = view_bbox()
+    raws = []
+    for node_id in range(1, number + 1):
+        raw = dict(id=node_id, uid=1, user="benchmark", version=1, changeset=1, timestamp="2020-01-01T00:00:00Z",
+                   type="node", lat=round(rng.uniform(south, north), 7), lon=round(rng.uniform(west, east), 7))
+        if node_id % 3 == 0:
+            raw["tags"] = {"amenity": "bench", "name": f"Bench {node_id}"}
+        raws.append(raw)
+    return raws
+
+
+def synthetic_gpx(path, number, rng):
+    """ Write a GPX file with a random walk through the view.
+
+    Args:
+        path (pathlib.Path): path of the file
+        number (int): number of track points
+        rng (random.Random): random number generator
+    """
+    west, south, east, north = view_bbox()
+    lat, lon = LAT, LON
+    step = (east - west) / 200
+    start = time.mktime((2020, 1, 1, 0, 0, 0, 0, 0, 0))
+    with open(path, "w") as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                   '<gpx version="1.1" creator="osmapy" xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>\n')
+        for i in range(number):
+            lat = min(max(lat + rng.uniform(-step, step), south), north)
+            lon = min(max(lon + rng.uniform(-step, step), west), east)
+            stamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(start + i))
+            file.write(f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}"><time>{stamp}</time></trkpt>\n')
+        file.write("</trkseg></trk></gpx>\n")
+
+
+def measure(function, repeat, setup=None):
+    """ Measure the duration of a function.
+
+    Args:
+        function (callable): function to measure
+        repeat (int): number of measurements
+        setup (callable): function which is called before every measurement and not measured
+
+    Returns:
+        dict: minimum, median and mean duration in milliseconds
+    """
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return {"repeat": repeat,
+            "min_ms": round(min(durations), 3),
+            "median_ms": round(statistics.median(durations), 3),
+            "mean_ms": round(statistics.mean(durations), 3)}
+
+
+def draw_layer(layer, viewer):
+    """ Draw one layer on an image of the size of the view.
+
+    Args:
+        layer (Object): object that implements a draw function
+        viewer (Viewer): view to draw
+    """
+    image = QImage(viewer.size(), QImage.Format_ARGB32_Premultiplied)
+    qpainter = QPainter(image)
+    layer.draw(viewer, qpainter, 1.0)
+    qpainter.end()
+
+
+def validate(elements_loader):
+    """ Validate all loaded nodes from scratch.
+
+    Args:
+        elements_loader (ElementsLoader): loader with the nodes
+    """
+    validator = elements_loader.validator
+    validator.clear()
+    for node in elements_loader.elements.values():
+        validator.add(node)
+
+
+def paint_view(viewer):
+    """ Paint the whole view with all layers.
+
+    Args:
+        viewer (Viewer): view to paint
+    """
+    image = QImage(viewer.size(), QImage.Format_ARGB32_Premultiplied)
+    viewer.render(image)
+
+
+class Benchmark:
+    """ Run the benchmarks and collect the results.
+    """
+
+    def __init__(self, path, repeat):
+        """
+        Args:
+            path (pathlib.Path): temporary folder for the caches
+            repeat (int): number of measurements of every benchmark
+        """
+        self.path = path
+        self.repeat = repeat
+        self.results = []
+        self.rng = random.Random(0)
+
+    def record(self, name, parameters, timing):
+        """ Add a result.
+
+        Args:
+            name (str): name of the benchmark
+            parameters (dict): parameters of the benchmark
+            timing (dict): result of measure()
+        """
+        self.results.append({"name": name, "parameters": parameters, **timing})
+
+    def window(self, name):
+        """ Create a new main window with empty caches.
+
+        Args:
+            name (str): name of the folder of the caches
+
+        Returns:
+            BenchmarkWindow: window with a viewer
+        """
+        window = BenchmarkWindow(self.path / name)
+        window.show()
+        return window
+
+    def paint_event(self, layer_numbers):
+        """ Viewer.paintEvent with a number of tile layers and a warm cache.
+
+        Args:
+            layer_numbers ([int]): numbers of tile layers
+        """
+        for number in layer_numbers:
+            window = self.window(f"paint_{number}")
+            for tile_loader in window.add_tile_layers(number):
+                tile_loader.warm(window.viewer)
+            self.record("Viewer.paintEvent", {"tile_layers": number},
+                        measure(lambda: paint_view(window.viewer), self.repeat))
+            window.close_loaders()
+
+    def tile_draw(self):
+        """ TileLoader.draw with a warm memory cache, with the tiles only on the disk and with a cold cache.
+        """
+        window = self.window("tiles")
+        tile_loader, = window.add_tile_layers(1)
+        tile_loader.warm(window.viewer)
+        self.record("TileLoader.draw", {"cache": "warm"},
+                    measure(lambda: draw_layer(tile_loader, window.viewer), self.repeat))
+        self.record("TileLoader.draw", {"cache": "disk"},
+                    measure(lambda: draw_layer(tile_loader, window.viewer), self.repeat, tile_loader.forget_images))
+        self.record("TileLoader.draw", {"cache": "cold"},
+                    measure(lambda: draw_layer(tile_loader, window.viewer), self.repeat, tile_loader.clear))
+        tile_loader.clear()
+        window.close_loaders()
+
+    def elements(self, node_numbers):
+        """ ElementsLoader.draw, a full validation and the hit test of a right click.
+
+        Args:
+            node_numbers ([int]): numbers of loaded nodes
+        """
+        for number in node_numbers:
+            window = self.window(f"elements_{number}")
+            elements_loader = window.elements_loader
+            elements_loader.merge([(raw, None, False) for raw in synthetic_nodes(number, self.rng)])
+            elements_loader.selected_node = 1
+            self.record("ElementsLoader.draw", {"nodes": number},
+                        measure(lambda: draw_layer(elements_loader, window.viewer), self.repeat))
+            self.record("Validator", {"nodes": number},
+                        measure(lambda: validate(elements_loader), self.repeat))
+            positions = [(self.rng.uniform(0, WIDTH), self.rng.uniform(0, HEIGHT)) for _ in range(self.repeat)]
+            self.record("Viewer.find_node", {"nodes": number},
+                        measure(lambda: window.viewer.find_node(*positions.pop()), self.repeat))
+            window.viewer.set_zoom(config.cluster_max_zoom)
+            self.record("ElementsLoader.draw", {"nodes": number, "zoom": config.cluster_max_zoom},
+                        measure(lambda: draw_layer(elements_loader, window.viewer), self.repeat))
+            window.close_loaders()
+
+    def gpx_draw(self, point_numbers):
+        """ GPXLoader.draw of a loaded track.
+
+        Args:
+            point_numbers ([int]): numbers of track points
+        """
+        window = self.window("gpx")
+        for number in point_numbers:
+            path = self.path / f"track_{number}.gpx"
+            synthetic_gpx(path, number, self.rng)
+            gpx_loader = GPXLoader(path)
+            gpx_loader.worker()  # load in this thread
+            for zoom in (ZOOM - 6, ZOOM):
+                window.viewer.set_zoom(zoom)
+                self.record("GPXLoader.draw", {"points": number, "zoom": zoom},
+                            measure(lambda: draw_layer(gpx_loader, window.viewer), self.repeat))
+            window.viewer.set_zoom(ZOOM)
+        window.close_loaders()
+
+    def osm_change(self, diff_sizes):
+        """ Changeset.create_osmChange of a large diff.
+
+        Args:
+            diff_sizes ([int]): numbers of changed nodes
+        """
+        window = self.window("changeset")
+        changeset = Changeset(window)
+        for number in diff_sizes:
+            nodes = [Node(raw) for raw in synthetic_nodes(number, self.rng)]
+            changes = [(("create", "modify", "delete")[node.id % 3], node) for node in nodes]
+            self.record("Changeset.create_osmChange", {"nodes": number},
+                        measure(lambda: changeset.create_osmChange(1, changes), self.repeat))
+        window.close_loaders()
+
+
+def parse_args(args=None):
+    """ Parse the command line arguments.
+
+    Args:
+        args ([str]): arguments, the arguments of the process by default
+
+    Returns:
+        argparse.Namespace: parsed arguments
+    """
+    parser = argparse.ArgumentParser(prog="python -m osmapy.Benchmark.Benchmark",
+                                     description="Benchmarks of the drawing and editing of Osmapy.")
+    parser.add_argument("--repeat", type=int, default=5, help="number of measurements of every benchmark")
+    parser.add_argument("--tile-layers", type=int, nargs="+", default=[1, 2, 4], help="numbers of tile layers")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1000, 10000, 100000], help="numbers of nodes")
+    parser.add_argument("--track-points", type=int, nargs="+", default=[100000, 1000000],
+                        help="numbers of GPX track points")
+    parser.add_argument("--diff-sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="numbers of changed nodes in an osmChange")
+    parser.add_argument("--output", type=Path, help="JSON file of the results, printed by default")
+    return parser.parse_args(args)
+
+
+def main():
+    args = parse_args()
+    app = QApplication()
+    config.load()
+    config.slippy_tiles = []  # no downloads, the tile layers are synthetic
+
+    with tempfile.TemporaryDirectory() as path:
+        benchmark = Benchmark(Path(path), args.repeat)
+        benchmark.paint_event(args.tile_layers)
+        benchmark.tile_draw()
+        benchmark.elements(args.nodes)
+        benchmark.gpx_draw(args.track_points)
+        benchmark.osm_change(args.diff_sizes)
+
+    report = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": platform.python_version(),
+              "pyside2": PySide2.__version__,
+              "platform": platform.platform(),
+              "qpa": app.platformName(),
+              "results": benchmark.results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
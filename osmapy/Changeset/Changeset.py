@@ -1,50 +1,228 @@
 # -*- coding: utf-8 -*-
 
-import lxml.etree as ET
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
+from PySide2.QtCore import QObject, Signal
+
+from osmapy.utils import lazy
 from osmapy.utils.config import config
 
 
-class Changeset:
-    """ Represent a changeset. Create it and send it to the server.
+def buffered(parts, size=64 * 1024):
+    """ Join small parts of a stream to blocks, so a streamed request body is not sent in tiny chunks.
+
+    Args:
+        parts (iterable): parts as bytes
+        size (int): minimal size of a block in bytes
+
+    Yields:
+        bytes: blocks of the stream
     """
+    block = []
+    length = 0
+    for part in parts:
+        block.append(part)
+        length += len(part)
+        if length >= size:
+            yield b"".join(block)
+            block = []
+            length = 0
+    if block:
+        yield b"".join(block)
+
+
+class UploadCancelled(Exception):
+    """ Raised in the upload worker when the user cancelled the upload.
+    """
+
+
+class Changeset(QObject):
+    """ Represent a changeset. Create it and send it to the server. Large edits are uploaded in chunks and spread over
+    several changesets to stay within the limits of the OSM API. The upload runs in the background over one
+    authenticated session and reports its progress with signals.
+    """
+
+    progress = Signal(int, int)  # number of uploaded chunks and number of all chunks
+    chunk_uploaded = Signal(bytes, int)  # diffResult of an uploaded chunk and the changeset id
+    finished = Signal(int, str)  # status code of the failed request or 200 and an error message
+    checked = Signal(list, str)  # conflicts of the version check and an error message
 
     def __init__(self, parent):
+        super(Changeset, self).__init__()
         self.parent = parent
         self.osm_api_url = config.osm_api_url
 
         self.headers = {"User-Agent": config.user_agent, "Content-Type": "application/xml"}
+        self.changeset_id = None
+        self.session = None
+        self.cancelled = threading.Event()
+
+        # the loaded elements are only changed in the GUI thread
+        self.chunk_uploaded.connect(self.apply_diff_result)
+        self.finished.connect(self.upload_finished)
 
     def submit(self, comment, username, password):
-        """ Submit the changeset to the server.
+        """ Start to submit the changeset to the server in the background. The changes are uploaded in chunks. Every
+        chunk which is acknowledged by the server is applied to the loaded elements, so after a failure a new submit
+        resumes with the remaining changes. The signal finished is emitted at the end.
 
         Args:
             comment (str): comment of this changeset
             username (str): users username
             password (str): users password
         """
-        self.username = username
-        self.password = password
+        changes = self.get_changes()
+        self.cancelled.clear()
+        threading.Thread(target=self.upload_worker, args=(comment, username, password, changes), daemon=True).start()
 
-        status_code = self.create_changeset(comment)
-        if status_code != 200:
-            return status_code
+    def check(self):
+        """ Start to check the versions of the modified and deleted nodes on the server in the background. The signal
+        checked is emitted with the conflicts at the end.
+        """
+        changes = [(action, node) for action, node in self.get_changes() if action != "create"]
+        threading.Thread(target=self.check_worker, args=(changes,), daemon=True).start()
+
+    def check_worker(self, changes):
+        """ Worker which fetches the current versions of the changed nodes. The nodes are requested in batches with
+        the multi fetch of the OSM API, the batches are sent in parallel over one pooled session.
 
-        osmChange = ET.tostring(self.create_osmChange(self.changeset_id))
-        status_code = self.upload_diff(osmChange)
-        if status_code != 200:
-            return status_code
+        Args:
+            changes ([(str, Node)]): modified and deleted nodes
+        """
+        requests = lazy.requests()
+
+        batch_size = config.conflict_check_batch_size
+        batches = [changes[i:i + batch_size] for i in range(0, len(changes), batch_size)]
+        conflicts, message = [], ""
+        with requests.Session() as session:
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=config.conflict_check_connections)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({"User-Agent": config.user_agent, "Accept": "application/json"})
+            try:
+                with ThreadPoolExecutor(config.conflict_check_connections) as executor:
+                    for batch_conflicts in executor.map(partial(self.check_batch, session), batches):
+                        conflicts += batch_conflicts
+            except Exception as e:
+                # e.g. a failed request or an unexpected answer, the dialog waits for the signal in any case
+                conflicts, message = [], f"The versions of the nodes could not be checked: {e}"
+        self.checked.emit(conflicts, message)
+
+    @staticmethod
+    def check_batch(session, changes):
+        """ Compare the versions of some nodes with their versions on the server.
 
-        status_code = self.close()
-        if status_code != 200:
-            return status_code
+        Args:
+            session (requests.Session): session for the request
+            changes ([(str, Node)]): modified and deleted nodes
 
-        self.parent.element_viewer.clear()
-        self.parent.elements_loader.clear()
-        self.parent.viewer.update()
+        Returns:
+            [(Node, dict)]: conflicting nodes with their raw node on the server. Nodes deleted on the server have no
+            coordinates and visible is false.
 
-        return status_code
+        Raises:
+            requests.exceptions.RequestException: if the request failed
+        """
+        nodes = {node.id: node for _, node in changes}
+        request = f"{config.osm_api_url}/api/0.6/nodes?nodes={','.join(str(node_id) for node_id in nodes)}"
+        result = session.get(request, timeout=config.api_timeout)
+        result.raise_for_status()
+        conflicts = []
+        for raw in result.json()["elements"]:
+            node = nodes[raw["id"]]
+            if str(raw["version"]) != node.data["version"] or not raw.get("visible", True):
+                conflicts.append((node, raw))
+        return conflicts
+
+    def cancel(self):
+        """ Cancel a running upload. The current changeset is closed.
+        """
+        self.cancelled.set()
+
+    def upload_worker(self, comment, username, password, changes):
+        """ Worker which uploads the changes over one session. The changeset is closed even if an error occurs.
+
+        Args:
+            comment (str): comment of this changeset
+            username (str): users username
+            password (str): users password
+            changes ([(str, Node)]): changes to upload
+        """
+        requests = lazy.requests()
+
+        self.session = requests.Session()
+        self.session.auth = (username, password)
+        self.session.headers.update(self.headers)
+        status_code, message = 0, ""
+        try:
+            status_code = self.upload(comment, changes)
+        except UploadCancelled:
+            message = "The upload was cancelled."
+        except requests.exceptions.RequestException as e:
+            message = str(e)
+        except Exception as e:
+            # e.g. an unexpected answer of the server, the dialog must be closed in any case
+            message = f"The upload failed: {e!r}"
+        finally:
+            if self.changeset_id is not None:
+                try:
+                    self.close()
+                except requests.exceptions.RequestException:
+                    pass
+            self.session.close()
+        self.finished.emit(status_code, message)
+
+    def upload(self, comment, changes):
+        """ Upload the changes chunk by chunk.
+
+        Args:
+            comment (str): comment of this changeset
+            changes ([(str, Node)]): changes to upload
+
+        Returns:
+            http status code of the failed request or 200
+        """
+        chunks = [changes[i:i + config.upload_chunk_size] for i in range(0, len(changes), config.upload_chunk_size)]
+
+        self.changeset_id = None
+        changeset_size = 0
+        for number, chunk in enumerate(chunks):
+            if self.cancelled.is_set():
+                raise UploadCancelled()
+            # open another changeset if the current one would become too large
+            if self.changeset_id is None or changeset_size + len(chunk) > config.changeset_max_elements:
+                if self.changeset_id is not None:
+                    status_code = self.close()
+                    if status_code != 200:
+                        return status_code
+                status_code = self.create_changeset(comment)
+                if status_code != 200:
+                    return status_code
+                changeset_size = 0
+
+            status_code, diff_result = self.upload_diff(self.iter_osmChange(self.changeset_id, chunk))
+            if status_code != 200:
+                return status_code
+            self.chunk_uploaded.emit(diff_result, self.changeset_id)
+            changeset_size += len(chunk)
+
+            self.progress.emit(number + 1, len(chunks))
+
+        return 200
+
+    def upload_finished(self, status_code, message):
+        """ Callback when the upload is finished. After a successful upload the loaded elements are outdated.
+
+        Args:
+            status_code (int): status code of the failed request or 200
+            message (str): error message
+        """
+        if status_code == 200:
+            self.parent.element_viewer.clear()
+            self.parent.elements_loader.discard()
+            self.parent.viewer.update()
 
     def create_changeset(self, comment):
         """ Ask server to create a changeset.
@@ -55,75 +233,136 @@ class Changeset:
         Returns:
             http status code of the response
         """
+        ET = lazy.etree()
+
         root = ET.Element("osm")
         changeset = ET.SubElement(root, "changeset")
         ET.SubElement(changeset, "tag", k="comment", v=comment)
         tree = ET.ElementTree(root)
 
         request = f"{config.osm_api_url}/api/0.6/changeset/create"
-        result = requests.put(request, data=ET.tostring(tree), headers=self.headers,
-                              auth=(self.username, self.password))
+        result = self.session.put(request, data=ET.tostring(tree), timeout=config.api_timeout)
         if result.status_code == 200:
             self.changeset_id = int(result.text)
         return result.status_code
 
-    def create_osmChange(self, changeset_id):
-        """ Create a osmChange XML file which describes the changes which where perfromed by the user.
-
-        Args:
-            changeset_id (int): number of the changeset declared by the server
+    def get_changes(self):
+        """ Find the changes which where performed by the user.
 
         Returns:
-            xml tree: containing all changes as an xml
+            [(str, Node)]: list of the actions "create", "modify" or "delete" with the changed node
         """
         elements_copy = self.parent.elements_loader.elements_copy
         elements = self.parent.elements_loader.elements
 
-        root = ET.Element("osmChange")
-
-        # created
-        create = ET.SubElement(root, "create")
-
-        created_node_keys = set(elements) - set(elements_copy)
-        created_nodes = [elements[k] for k in created_node_keys]
+        created_node_keys = sorted(set(elements) - set(elements_copy), reverse=True)
+        deleted_node_keys = sorted(set(elements_copy) - set(elements))
+        keys = sorted(set(elements).intersection(set(elements_copy)))
+        modified_node_keys = [k for k in keys if elements[k] != elements_copy[k]]
 
-        for i, node in enumerate(created_nodes):
-            create.insert(-1, node.create_xml(-i - 1, changeset_id))
+        return [("create", elements[k]) for k in created_node_keys] + \
+               [("modify", elements[k]) for k in modified_node_keys] + \
+               [("delete", elements_copy[k]) for k in deleted_node_keys]
 
-        # deleted
-        delete = ET.SubElement(root, "delete")
+    def iter_osmChange(self, changeset_id, changes=None):
+        """ Serialize a osmChange XML file which describes the changes which where perfromed by the user. The file is
+        generated node by node, so it can be streamed without holding the whole document in memory. New nodes keep
+        their negative ids as placeholders.
 
-        deleted_node_keys = set(elements_copy) - set(elements)
-        deleted_nodes = [elements_copy[k] for k in deleted_node_keys]
+        Args:
+            changeset_id (int): number of the changeset declared by the server
+            changes ([(str, Node)]): changes to include, all changes of the user by default
 
-        for i, node in enumerate(deleted_nodes):
-            delete.insert(-1, node.create_xml(node.id, changeset_id, tags=False))
+        Yields:
+            bytes: consecutive parts of the XML document
+        """
+        ET = lazy.etree()
+
+        if changes is None:
+            changes = self.get_changes()
+
+        yield b"<osmChange>"
+        current_action = None
+        for action, node in changes:
+            if action != current_action:
+                if current_action:
+                    yield f"</{current_action}>".encode()
+                yield f"<{action}>".encode()
+                current_action = action
+            yield ET.tostring(node.create_xml(node.id, changeset_id, tags=action != "delete"))
+        if current_action:
+            yield f"</{current_action}>".encode()
+        yield b"</osmChange>"
+
+    def create_osmChange(self, changeset_id, changes=None):
+        """ Create a osmChange XML file which describes the changes which where perfromed by the user.
 
-        # modified
-        modify = ET.SubElement(root, "modify")
+        Args:
+            changeset_id (int): number of the changeset declared by the server
+            changes ([(str, Node)]): changes to include, all changes of the user by default
 
-        keys = set(elements).intersection(set(elements_copy))
-        modified_nodes = [elements[k] for k in keys if elements[k] != elements_copy[k]]
+        Returns:
+            xml tree: containing all changes as an xml
+        """
+        ET = lazy.etree()
 
-        for i, node in enumerate(modified_nodes):
-            modify.insert(-1, node.create_xml(node.id, changeset_id))
+        return ET.ElementTree(ET.fromstring(b"".join(self.iter_osmChange(changeset_id, changes))))
 
-        tree = ET.ElementTree(root)
+    def export_osmChange(self, path):
+        """ Write all changes of the user to a local osmChange (.osc) file. The file is written node by node.
 
-        return tree
+        Args:
+            path (str): path of the file
+        """
+        with open(path, "wb") as file:
+            for part in self.iter_osmChange(-1):
+                file.write(part)
 
     def upload_diff(self, osm_change):
         """ Upload osmChange file to the server
 
         Args:
-            osm_change (str): xml as a string
+            osm_change (iterable): parts of the xml as bytes, they are sent as a streamed request body
 
         Returns:
-            http status code of the response
+            (int, bytes): http status code and the diffResult of the response
         """
         request = f"{config.osm_api_url}/api/0.6/changeset/{self.changeset_id}/upload"
-        result = requests.post(request, data=osm_change, headers=self.headers, auth=(self.username, self.password))
-        return result.status_code
+        result = self.session.post(request, data=self.check_cancelled(buffered(osm_change)), timeout=config.api_timeout)
+        return result.status_code, result.content
+
+    def check_cancelled(self, parts):
+        """ Stop a streamed request body as soon as the upload is cancelled.
+
+        Args:
+            parts (iterable): parts of the request body
+
+        Yields:
+            bytes: parts of the request body
+        """
+        for part in parts:
+            if self.cancelled.is_set():
+                raise UploadCancelled()
+            yield part
+
+    def apply_diff_result(self, diff_result, changeset_id):
+        """ Apply the diffResult of an upload to the loaded elements. The placeholder ids of new nodes are replaced by
+        the ids of the server and the versions are updated.
+
+        Args:
+            diff_result (bytes): diffResult XML of the server
+            changeset_id (int): changeset of the upload
+        """
+        ET = lazy.etree()
+
+        results = []
+        for node in ET.fromstring(diff_result).iter("node"):
+            new_id = node.get("new_id")
+            new_version = node.get("new_version")
+            results.append((int(node.get("old_id")),
+                            int(new_id) if new_id else None,
+                            int(new_version) if new_version else None))
+        self.parent.elements_loader.acknowledge(results, changeset_id)
 
     def close(self):
         """ Close the changeset to finish the editing
@@ -132,5 +371,6 @@ class Changeset:
             http status code of the response
         """
         request = f"{config.osm_api_url}/api/0.6/changeset/{self.changeset_id}/close"
-        result = requests.put(request, headers=self.headers, auth=(self.username, self.password))
+        self.changeset_id = None
+        result = self.session.put(request, timeout=config.api_timeout)
         return result.status_code
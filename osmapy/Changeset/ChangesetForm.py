@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 
-import lxml.etree as ET
-from PySide2.QtWidgets import QDialog, QGridLayout, QLabel, QTextEdit, QLineEdit, QPushButton, QMessageBox
+from PySide2 import QtCore
+from PySide2.QtWidgets import (QDialog, QGridLayout, QLabel, QTextEdit, QLineEdit, QPushButton, QMessageBox,
+                               QFileDialog, QProgressDialog, QListWidget, QListWidgetItem)
 
+from osmapy.utils import lazy
 from osmapy.utils.config import config
 
 
@@ -19,11 +21,24 @@ class ChangesetForm(QDialog):
                              405: "Method Not Allowed",
                              409: "Conflict"}
 
+        self.progress_dialog = None
+        self.parent.changeset.progress.connect(self.show_progress)
+        self.parent.changeset.finished.connect(self.upload_finished)
+        self.parent.changeset.checked.connect(self.check_finished)
+
     def show(self):
+        ET = lazy.etree()
+
         # reset layout
         QDialog().setLayout(self.layout())
 
-        osm_change = ET.tostring(self.parent.changeset.create_osmChange(-1), pretty_print=True).decode()
+        # only the first changes are previewed, the complete file can be exported
+        changes = self.parent.changeset.get_changes()
+        preview_size = 100
+        osm_change = ET.tostring(self.parent.changeset.create_osmChange(-1, changes[:preview_size]),
+                                 pretty_print=True).decode()
+        if len(changes) > preview_size:
+            osm_change += f"\n... and {len(changes) - preview_size} more changes"
 
         self.setWindowTitle("Upload changes")
 
@@ -32,6 +47,20 @@ class ChangesetForm(QDialog):
         text.setReadOnly(True)
         text.setText(osm_change)
 
+        # problems of the created and modified nodes, a click shows the node
+        validator = self.parent.elements_loader.validator
+        issues = QListWidget()
+        for action, node in changes:
+            if action == "delete":
+                continue
+            for issue in validator.issues(node.id):
+                item = QListWidgetItem(f"Node {node.id}: {issue}")
+                item.setData(QtCore.Qt.UserRole, node.id)
+                issues.addItem(item)
+        issues.itemClicked.connect(self.show_node)
+        label_issues = QLabel(f"Validation: {issues.count()} problems found" if issues.count() else
+                              "Validation: no problems found")
+
         label2 = QLabel("Comment:")
         self.comment = QLineEdit()
 
@@ -43,17 +72,21 @@ class ChangesetForm(QDialog):
         self.password.setEchoMode(QLineEdit.Password)
 
         button = QPushButton("Submit Changes")
+        button_export = QPushButton("Export osmChange File")
 
         layout = QGridLayout()
         layout.addWidget(label1, 0, 0, 1, 2)
         layout.addWidget(text, 1, 0, 1, 2)
-        layout.addWidget(label2, 2, 0, 1, 1)
-        layout.addWidget(self.comment, 2, 1, 1, 1)
-        layout.addWidget(label3, 3, 0, 1, 1)
-        layout.addWidget(self.username, 3, 1, 1, 1)
-        layout.addWidget(label4, 4, 0, 1, 1)
-        layout.addWidget(self.password, 4, 1, 1, 1)
-        layout.addWidget(button, 5, 0, 1, 2)
+        layout.addWidget(label_issues, 2, 0, 1, 2)
+        layout.addWidget(issues, 3, 0, 1, 2)
+        layout.addWidget(label2, 4, 0, 1, 1)
+        layout.addWidget(self.comment, 4, 1, 1, 1)
+        layout.addWidget(label3, 5, 0, 1, 1)
+        layout.addWidget(self.username, 5, 1, 1, 1)
+        layout.addWidget(label4, 6, 0, 1, 1)
+        layout.addWidget(self.password, 6, 1, 1, 1)
+        layout.addWidget(button, 7, 0, 1, 2)
+        layout.addWidget(button_export, 8, 0, 1, 2)
         self.setLayout(layout)
 
         if "login_name" in config:
@@ -62,8 +95,24 @@ class ChangesetForm(QDialog):
             self.password.setText(config.password)
 
         button.clicked.connect(self.click)
+        button_export.clicked.connect(self.export)
         super().show()
 
+    def show_node(self, item):
+        """ Callback when a problem is clicked. The node is selected and the map is moved to it.
+
+        Args:
+            item (QListWidgetItem): clicked item
+        """
+        self.parent.viewer.select_node(item.data(QtCore.Qt.UserRole))
+
+    def export(self):
+        """ Ask the user for a path and save the changes as an osmChange file.
+        """
+        path, _ = QFileDialog.getSaveFileName(self, "Export osmChange File", "changes.osc", "osmChange (*.osc)")
+        if path:
+            self.parent.changeset.export_osmChange(path)
+
     def click(self):
         if self.username.text() == "":
             box = QMessageBox()
@@ -84,7 +133,84 @@ class ChangesetForm(QDialog):
             box.exec()
             return
 
-        status_codes = self.parent.changeset.submit(self.comment.text(), self.username.text(), self.password.text())
+        # conflicts with edits of other users are found before the upload instead of failing it
+        self.progress_dialog = QProgressDialog("Checking the versions of the changed nodes...", "Cancel", 0, 0, self)
+        self.progress_dialog.setCancelButton(None)
+        self.progress_dialog.setWindowTitle("Upload changes")
+        self.progress_dialog.setWindowModality(QtCore.Qt.ApplicationModal)
+        self.progress_dialog.setMinimumDuration(0)
+        self.progress_dialog.show()
+
+        self.parent.changeset.check()
+
+    def check_finished(self, conflicts, message):
+        """ Callback when the versions of the changed nodes were checked in the background. Without conflicts the
+        upload starts. Conflicting nodes can be refreshed from the server, their local edits are lost.
+
+        Args:
+            conflicts ([(Node, dict)]): conflicting nodes with their raw node on the server
+            message (str): error message if the check failed
+        """
+        self.progress_dialog.close()
+        self.progress_dialog = None
+
+        if message:
+            box = QMessageBox()
+            box.setWindowTitle("ERROR")
+            box.setText(message)
+            box.setIcon(QMessageBox.Icon.Critical)
+            box.exec()
+            return
+
+        if conflicts:
+            listed = 20
+            lines = []
+            for node, raw in conflicts[:listed]:
+                if raw.get("visible", True):
+                    lines.append(f"Node {node.id}: version {node.data['version']}, on the server {raw['version']}")
+                else:
+                    lines.append(f"Node {node.id}: deleted on the server")
+            if len(conflicts) > listed:
+                lines.append(f"... and {len(conflicts) - listed} more nodes")
+            box = QMessageBox()
+            box.setWindowTitle("Conflicts")
+            box.setText(f"{len(conflicts)} of the changed nodes were edited by someone else in the meantime:\n\n"
+                        + "\n".join(lines) +
+                        "\n\nRefresh these nodes from the server and upload the remaining changes? "
+                        "Your edits of these nodes are lost.")
+            box.setIcon(QMessageBox.Icon.Warning)
+            box.setStandardButtons(QMessageBox.Yes | QMessageBox.Cancel)
+            if box.exec() != QMessageBox.Yes:
+                return
+            self.parent.elements_loader.refresh([raw for _, raw in conflicts if raw.get("visible", True)],
+                                                [raw["id"] for _, raw in conflicts if not raw.get("visible", True)])
+            self.parent.element_viewer.clear()
+            self.parent.viewer.update()
+            if not self.parent.changeset.get_changes():
+                self.hide()
+                return
+
+        # the dialog is modal, so the elements are not changed during the upload
+        self.progress_dialog = QProgressDialog("Uploading changes...", "Cancel", 0, 0, self)
+        self.progress_dialog.setWindowTitle("Upload changes")
+        self.progress_dialog.setWindowModality(QtCore.Qt.ApplicationModal)
+        self.progress_dialog.setMinimumDuration(0)
+        self.progress_dialog.canceled.connect(self.parent.changeset.cancel)
+        self.progress_dialog.show()
+
+        self.parent.changeset.submit(self.comment.text(), self.username.text(), self.password.text())
+
+    def upload_finished(self, status_codes, message):
+        """ Callback when the upload in the background is finished.
+
+        Args:
+            status_codes (int): status code of the failed request or 200
+            message (str): error message if no request failed
+        """
+        if self.progress_dialog is not None:
+            self.progress_dialog.canceled.disconnect(self.parent.changeset.cancel)
+            self.progress_dialog.close()
+            self.progress_dialog = None
 
         self.parent.viewer.load_elements()
         self.hide()
@@ -98,8 +224,21 @@ class ChangesetForm(QDialog):
         else:
             box = QMessageBox()
             box.setWindowTitle("ERROR")
-            box.setText(f"Error:\n{self.status_codes[status_codes]}")
+            if not message:
+                message = self.status_codes.get(status_codes, f"HTTP status {status_codes}")
+            box.setText(f"Error:\n{message}\n\n"
+                        f"The uploaded parts are kept. Submit again to upload the remaining changes.")
             box.setIcon(QMessageBox.Icon.Critical)
             box.exec()
 
-
+    def show_progress(self, uploaded, total):
+        """ Show the progress of the upload.
+
+        Args:
+            uploaded (int): number of uploaded chunks
+            total (int): number of all chunks
+        """
+        if self.progress_dialog is not None:
+            self.progress_dialog.setMaximum(total)
+            self.progress_dialog.setValue(uploaded)
+            self.progress_dialog.setLabelText(f"Uploaded {uploaded} of {total} parts of the changes")
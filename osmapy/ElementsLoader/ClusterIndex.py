@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import math
+
+
+class ClusterIndex:
+    """ Grid based clustering of the nodes for every zoom level up to a maximum zoom level. At every zoom level the
+    nodes are counted in grid cells of a fixed size in pixels. The cell of a zoom level is split into four cells at the
+    next zoom level, so the clusters form a hierarchy. For every cell only the number of nodes and the sum of their
+    positions is kept, so adding, moving and deleting a node only updates one cell per zoom level.
+    """
+
+    def __init__(self, max_zoom, radius, image_size=256):
+        """
+        Args:
+            max_zoom (int): deepest zoom level with clusters
+            radius (float): size of the grid cells in pixels
+            image_size (int): size of a slippy tile in pixels
+        """
+        self.max_zoom = max_zoom
+        # size of the cells in mercator coordinates, it is halved from one zoom level to the next
+        self.cell_sizes = [radius * 360 / (image_size * 2 ** zoom) for zoom in range(max_zoom + 1)]
+        self.levels = [dict() for _ in range(max_zoom + 1)]  # cell -> [number of nodes, sum of x, sum of y]
+        self.positions = dict()  # indexed position of every node
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, node):
+        """ Add a node to the clusters.
+
+        Args:
+            node (Node): node to add
+        """
+        self.positions[node.id] = (node.x, node.y)
+        for cell_size, cells in zip(self.cell_sizes, self.levels):
+            key = (math.floor(node.x / cell_size), math.floor(node.y / cell_size))
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [1, node.x, node.y]
+            else:
+                cell[0] += 1
+                cell[1] += node.x
+                cell[2] += node.y
+
+    def remove(self, node):
+        """ Remove a node from the clusters. The position is taken from the index, so it can be removed after it moved.
+
+        Args:
+            node (Node): node to remove
+        """
+        if node.id not in self.positions:
+            return
+        x, y = self.positions.pop(node.id)
+        for cell_size, cells in zip(self.cell_sizes, self.levels):
+            key = (math.floor(x / cell_size), math.floor(y / cell_size))
+            cell = cells[key]
+            if cell[0] == 1:
+                del cells[key]
+            else:
+                cell[0] -= 1
+                cell[1] -= x
+                cell[2] -= y
+
+    def clear(self):
+        """ Remove all nodes.
+        """
+        self.levels = [dict() for _ in range(self.max_zoom + 1)]
+        self.positions = dict()
+
+    def clusters(self, zoom, left, bottom, right, top):
+        """ Find the clusters in a bounding box.
+
+        Args:
+            zoom (int): zoom level, at most the maximum zoom level
+            left (float): mercator x of the left border
+            bottom (float): mercator y of the bottom border
+            right (float): mercator x of the right border
+            top (float): mercator y of the top border
+
+        Returns:
+            [(float, float, int)]: mean position and number of nodes of every cluster
+        """
+        cell_size, cells = self.cell_sizes[zoom], self.levels[zoom]
+        x_range = range(math.floor(left / cell_size), math.floor(right / cell_size) + 1)
+        y_range = range(math.floor(bottom / cell_size), math.floor(top / cell_size) + 1)
+        if len(x_range) * len(y_range) < len(cells):
+            keys = ((x, y) for x in x_range for y in y_range if (x, y) in cells)
+        else:
+            keys = (key for key in cells if key[0] in x_range and key[1] in y_range)
+        return [(cells[key][1] / cells[key][0], cells[key][2] / cells[key][0], cells[key][0]) for key in keys]
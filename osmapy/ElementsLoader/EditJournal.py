@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+import time
+
+
+class EditJournal:
+    """ Append-only journal of the edits since the last checkpoint of the ElementStore. Every edit is written as one
+    compact JSON line as soon as it happens. The file is flushed for every record and synced to the disk at most once
+    per sync interval, so a crash loses nothing and typing does not wait for the disk. Records which were not synced
+    are synced by a timer at the end of the interval, also if no further edit follows.
+
+    Records are lists with an operation code and the node id:
+        ["c", id, lat, lon]   create node
+        ["m", id, lat, lon]   move node
+        ["t", id, key, value] set tag
+        ["u", id, key]        remove tag
+        ["d", id]             delete node
+        ["r", id, raw]        restore node from a raw node, e.g. to undo a deletion
+    """
+
+    def __init__(self, path, sync_interval=1.0):
+        """ Open the journal. The file and its folder are created if they do not exist.
+
+        Args:
+            path (pathlib.Path): path of the journal file
+            sync_interval (float): seconds between two syncs to the disk
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.sync_interval = sync_interval
+        self.file = open(path, "a", encoding="utf-8")
+        self.last_sync = time.time()
+        self.unsynced = 0
+        self.lock = threading.Lock()
+        self.timer = None  # pending sync of the last records
+
+    def append(self, record):
+        """ Append a record to the journal.
+
+        Args:
+            record (list): operation code, node id and the arguments of the operation
+        """
+        with self.lock:
+            self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self.file.flush()
+            self.unsynced += 1
+            elapsed = time.time() - self.last_sync
+            if elapsed >= self.sync_interval:
+                self.write_to_disk()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.sync_interval - elapsed, self.sync)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def sync(self):
+        """ Write all appended records to the disk.
+        """
+        with self.lock:
+            self.write_to_disk()
+
+    def write_to_disk(self):
+        """ Write all appended records to the disk. The lock must be held.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.unsynced and not self.file.closed:
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+        self.last_sync = time.time()
+
+    def records(self):
+        """ Read all records of the journal. A last line which was only written partially is ignored.
+
+        Returns:
+            [list]: records in the order they were appended
+        """
+        records = []
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+        return records
+
+    def truncate(self):
+        """ Remove all records, e.g. after they were saved in the ElementStore.
+        """
+        with self.lock:
+            self.file.seek(0)
+            self.file.truncate()
+            self.unsynced = 1
+            self.write_to_disk()
+
+    def close(self):
+        """ Sync and close the journal.
+        """
+        with self.lock:
+            self.write_to_disk()
+            self.file.close()
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+import json
+import sqlite3
+import threading
+import time
+
+
+class ElementStore:
+    """ On-disk store for OSM nodes based on SQLite. For every node the pristine state of the server and the local edit
+    are kept. The positions are indexed with an R-tree, so the nodes of an area can be queried without the OSM API.
+    The areas which were loaded from the server are saved with their load time.
+    """
+
+    def __init__(self, path):
+        """ Open the store. The database file and its folder are created if they do not exist.
+
+        Args:
+            path (pathlib.Path): path of the SQLite database file
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        # the write-ahead log makes the small commits of single edits cheap
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS nodes ("
+                                    "id INTEGER PRIMARY KEY, "
+                                    "pristine TEXT, "  # raw node of the server, NULL for new nodes
+                                    "local TEXT, "  # raw node with the local edits, NULL if not modified
+                                    "deleted INTEGER NOT NULL DEFAULT 0, "
+                                    "loaded REAL)")
+            self.connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS node_index "
+                                    "USING rtree(id, min_lon, max_lon, min_lat, max_lat)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS areas ("
+                                    "west REAL, south REAL, east REAL, north REAL, loaded REAL)")
+
+    def area_loaded(self, west, south, east, north):
+        """ Check if an area was completely loaded from the server before.
+
+        Args:
+            west (float): longitude of the bounding box in degree
+            south (float): latitude of the bounding box in degree
+            east (float): longitude of the bounding box in degree
+            north (float): latitude of the bounding box in degree
+
+        Returns:
+            float: unix time of the newest load which covers the area. None if the area was never loaded.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT MAX(loaded) FROM areas "
+                                          "WHERE west <= ? AND south <= ? AND east >= ? AND north >= ?",
+                                          (west, south, east, north)).fetchone()
+        return row[0]
+
+    def add_area(self, west, south, east, north, raws):
+        """ Save the nodes of an area which was loaded from the server. The pristine state of the nodes is replaced,
+        local edits are kept.
+
+        Args:
+            west (float): longitude of the bounding box in degree
+            south (float): latitude of the bounding box in degree
+            east (float): longitude of the bounding box in degree
+            north (float): latitude of the bounding box in degree
+            raws ([dict]): raw nodes of the OSM server answer
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            self.insert_nodes(raws, now)
+            self.connection.execute("INSERT INTO areas VALUES (?, ?, ?, ?, ?)", (west, south, east, north, now))
+
+    def add_nodes(self, raws):
+        """ Save nodes which were loaded from the server without a complete area, e.g. with a filter. The pristine
+        state of the nodes is replaced, local edits are kept.
+
+        Args:
+            raws ([dict]): raw nodes of the OSM server answer
+        """
+        with self.lock, self.connection:
+            self.insert_nodes(raws, time.time())
+
+    def insert_nodes(self, raws, now):
+        """ Insert or update nodes and their index. The lock must be held and a transaction must be open.
+
+        Args:
+            raws ([dict]): raw nodes of the OSM server answer
+            now (float): time of the loading
+        """
+        # no upsert, it needs SQLite 3.24 which is not shipped with every supported Python
+        self.connection.executemany("INSERT OR IGNORE INTO nodes (id) VALUES (?)", ((raw["id"],) for raw in raws))
+        self.connection.executemany("UPDATE nodes SET pristine = ?, loaded = ? WHERE id = ?",
+                                    ((json.dumps(raw), now, raw["id"]) for raw in raws))
+        # nodes with local edits keep the indexed position of the edit
+        self.connection.executemany("INSERT OR REPLACE INTO node_index "
+                                    "SELECT ?, ?, ?, ?, ? WHERE NOT EXISTS "
+                                    "(SELECT 1 FROM nodes WHERE id = ? AND local IS NOT NULL)",
+                                    ((raw["id"], raw["lon"], raw["lon"], raw["lat"], raw["lat"], raw["id"])
+                                     for raw in raws))
+
+    def query(self, west, south, east, north):
+        """ Get all stored nodes inside of a bounding box.
+
+        Args:
+            west (float): longitude of the bounding box in degree
+            south (float): latitude of the bounding box in degree
+            east (float): longitude of the bounding box in degree
+            north (float): latitude of the bounding box in degree
+
+        Returns:
+            [(dict, dict, bool)]: tuples with the pristine raw node, the raw node with local edits and the deletion
+            flag. The pristine node is None for new nodes, the local node is None for unmodified nodes.
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT nodes.pristine, nodes.local, nodes.deleted "
+                                           "FROM node_index JOIN nodes ON nodes.id = node_index.id "
+                                           "WHERE node_index.min_lon <= ? AND node_index.max_lon >= ? "
+                                           "AND node_index.min_lat <= ? AND node_index.max_lat >= ?",
+                                           (east, west, north, south)).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def pending(self):
+        """ Get all nodes with local edits, e.g. to restore them after a restart.
+
+        Returns:
+            [(dict, dict, bool)]: same format as in query()
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT pristine, local, deleted FROM nodes "
+                                           "WHERE local IS NOT NULL OR deleted = 1").fetchall()
+        return [self._decode(row) for row in rows]
+
+    def get(self, node_id):
+        """ Get a stored node.
+
+        Args:
+            node_id (int): id of the node
+
+        Returns:
+            (dict, dict, bool): same format as in query(). None if the node is not stored.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT pristine, local, deleted FROM nodes WHERE id = ?",
+                                          (node_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def save_edits(self, raws, deleted_ids):
+        """ Save the local edits of nodes in one transaction.
+
+        Args:
+            raws ([dict]): raw nodes with the local edits
+            deleted_ids ([int]): ids of the deleted nodes. New nodes which were never uploaded are removed completely.
+        """
+        with self.lock:
+            # the journal is truncated after this commit, so it must survive a power loss like the journal
+            self.connection.execute("PRAGMA synchronous=FULL")
+            try:
+                with self.connection:
+                    for raw in raws:
+                        self.connection.execute("INSERT OR IGNORE INTO nodes (id) VALUES (?)", (raw["id"],))
+                        self.connection.execute("UPDATE nodes SET local = ?, deleted = 0 WHERE id = ?",
+                                                (json.dumps(raw), raw["id"]))
+                        self.connection.execute("INSERT OR REPLACE INTO node_index VALUES (?, ?, ?, ?, ?)",
+                                                (raw["id"], raw["lon"], raw["lon"], raw["lat"], raw["lat"]))
+                    for node_id in deleted_ids:
+                        self.connection.execute("UPDATE nodes SET local = NULL, deleted = 1 WHERE id = ?", (node_id,))
+                        self.connection.execute("DELETE FROM node_index WHERE id = ? AND id IN "
+                                                "(SELECT id FROM nodes WHERE pristine IS NULL)", (node_id,))
+                        self.connection.execute("DELETE FROM nodes WHERE id = ? AND pristine IS NULL", (node_id,))
+            finally:
+                self.connection.execute("PRAGMA synchronous=NORMAL")
+
+    def acknowledge(self, nodes):
+        """ Replace nodes by the state which was uploaded to the server. The local edits become the pristine states. All
+        nodes are replaced in one transaction.
+
+        Args:
+            nodes ([(int, dict)]): id of every node before the upload, the placeholder id for new nodes, and the raw
+                node as it is on the server now. The raw node is None if the node was deleted.
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            for old_id, raw in nodes:
+                self.connection.execute("DELETE FROM nodes WHERE id = ?", (old_id,))
+                self.connection.execute("DELETE FROM node_index WHERE id = ?", (old_id,))
+                if raw is not None:
+                    self.connection.execute("INSERT OR REPLACE INTO nodes (id, pristine, loaded) VALUES (?, ?, ?)",
+                                            (raw["id"], json.dumps(raw), now))
+                    self.connection.execute("INSERT OR REPLACE INTO node_index VALUES (?, ?, ?, ?, ?)",
+                                            (raw["id"], raw["lon"], raw["lon"], raw["lat"], raw["lat"]))
+
+    def discard_edits(self):
+        """ Throw away all local edits. The nodes are reset to their pristine state.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM node_index WHERE id IN (SELECT id FROM nodes WHERE pristine IS NULL)")
+            self.connection.execute("DELETE FROM nodes WHERE pristine IS NULL")
+            moved = self.connection.execute("SELECT id, pristine FROM nodes WHERE local IS NOT NULL").fetchall()
+            for node_id, pristine in moved:
+                raw = json.loads(pristine)
+                self.connection.execute("INSERT OR REPLACE INTO node_index VALUES (?, ?, ?, ?, ?)",
+                                        (node_id, raw["lon"], raw["lon"], raw["lat"], raw["lat"]))
+            self.connection.execute("UPDATE nodes SET local = NULL, deleted = 0")
+
+    def invalidate_areas(self):
+        """ Forget which areas were loaded, so they are loaded from the server again. E.g. after an upload the
+        stored pristine state is outdated.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM areas")
+
+    def close(self):
+        """ Close the database.
+        """
+        with self.lock:
+            self.connection.close()
+
+    @staticmethod
+    def _decode(row):
+        pristine, local, deleted = row
+        return (json.loads(pristine) if pristine else None,
+                json.loads(local) if local else None,
+                bool(deleted))
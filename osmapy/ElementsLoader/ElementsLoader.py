@@ -1,22 +1,41 @@
 # -*- coding: utf-8 -*-
 
+import json
+import math
+import pathlib
+import re
+import time
+from collections import defaultdict, deque
 from string import Template
 
-import requests
 from PySide2 import QtCore
-from PySide2.QtGui import QColor, QPen
+from PySide2.QtCore import QPointF
+from PySide2.QtGui import QBrush, QColor, QFont, QPen
 from PySide2.QtWidgets import QMessageBox
 
 from osmapy.ElementsLoader import Node
-from osmapy.utils import calc
+from osmapy.ElementsLoader.ClusterIndex import ClusterIndex
+from osmapy.ElementsLoader.EditJournal import EditJournal
+from osmapy.ElementsLoader.ElementStore import ElementStore
+from osmapy.ElementsLoader.StyleEngine import StyleEngine
+from osmapy.ElementsLoader.TagIndex import TagIndex
+from osmapy.ElementsLoader.Validator import Validator
+from osmapy.utils import calc, lazy
 from osmapy.utils.config import config
 
 
 class ElementsLoader:
-    """ This class provides a loader for OSM elements from the OSM server.
+    """ This class provides a loader for OSM elements from the OSM server. All loaded elements and the local edits are
+    kept in an ElementStore, so known areas are loaded without the server and edits survive a restart. Every edit is
+    written to an EditJournal immediately and saved in the store at checkpoints. The inverse of every edit is kept for
+    local undo and redo. Indices of the elements, e.g. the clusters, are updated with every change of a node.
     """
 
-    def __init__(self):
+    def __init__(self, path_cache=None):
+        """
+        Args:
+            path_cache (pathlib.Path): folder of the store and the journal, the cache folder of Osmapy by default
+        """
         self.elements_copy = dict()  # copy of elements to find changes
         self.elements = dict()
         self.headers = {"Accept": "application/json", "User-Agent": config.user_agent}
@@ -24,17 +43,93 @@ class ElementsLoader:
         self.selected_node = None
         self.new_node_counter = -1
 
+        if path_cache is None:
+            path_cache = pathlib.Path(__file__).parent / pathlib.Path("../../cache")
+        self.store = ElementStore(path_cache / "elements.sqlite")
+        self.journal = EditJournal(path_cache / "edits.journal")
+        self.dirty = set()  # ids of the nodes edited since the last checkpoint
+        self.undo_stack = deque(maxlen=config.undo_limit)  # (edit, inverse edit, time) of the last edits
+        self.redo_stack = []
+        self.styles = StyleEngine(config.get("node_styles") or [])
+        self.clusters = ClusterIndex(config.cluster_max_zoom, config.cluster_radius, config.image_size)
+        self.tag_index = TagIndex()
+        self.validator = Validator(config.duplicate_distance)
+        # objects with add(node), remove(node) and clear()
+        self.indices = [self.clusters, self.tag_index, self.validator]
+        self.load_filter = config.get("load_filter") or ""  # only nodes with these tags are loaded, see overpass_query
+        self.search_query = ""
+        self.search_result = ("", -1, set())  # query, version of the tag index and ids of the found nodes
+        self.highlight_pen = QPen(QColor(255, 215, 0), 3)
+        self.cluster_brush = QBrush(QColor(255, 140, 0, 200))
+        self.cluster_pen = QPen(QColor(QtCore.Qt.black), 1)
+        self.cluster_font = QFont()
+        self.cluster_font.setPointSize(8)
+        self.restore_edits()
+
     def clear(self):
         """ Reset the elements dicts and the counter
         """
         self.selected_node = None
         self.new_node_counter = -1
         self.elements_copy = dict()
-        self.elements = dict()
+        self.reset_nodes(dict())
+
+    def put_node(self, node):
+        """ Add a node to the elements or replace the node with the same id. The indices are updated.
+
+        Args:
+            node (Node): new node
+        """
+        old_node = self.elements.get(node.id)
+        for index in self.indices:
+            if old_node is not None:
+                index.remove(old_node)
+            index.add(node)
+        self.elements[node.id] = node
+
+    def pop_node(self, node_id):
+        """ Remove a node from the elements and from the indices.
+
+        Args:
+            node_id (int): id of the node
+
+        Returns:
+            Node: removed node or None if it was not loaded
+        """
+        node = self.elements.pop(node_id, None)
+        if node is not None:
+            for index in self.indices:
+                index.remove(node)
+        return node
+
+    def reset_nodes(self, elements):
+        """ Replace all elements and build the indices again.
+
+        Args:
+            elements ({Node}): new elements with the ids as keys
+        """
+        self.elements = elements
+        for index in self.indices:
+            index.clear()
+            for node in elements.values():
+                index.add(node)
+
+    def restore_edits(self):
+        """ Load all nodes with local edits from the store and replay the journal, so they can be modified and uploaded
+        again.
+        """
+        self.merge(self.store.pending())
+        self.replay_journal()
+        self.checkpoint()
+        new_ids = [node_id for node_id in self.elements if node_id < 0]
+        if new_ids:
+            self.new_node_counter = min(new_ids) - 1
 
     def load(self, west, north, east, south):
         """ This function loads all node elements from a given bounding box. The function returns all nodes loaded with
-        this object so far.
+        this object so far. Areas which were loaded from the server recently are read from the store. If the server
+        cannot be reached the stored nodes are used. With a load filter only the matching nodes are loaded from the
+        Overpass API, if it fails the whole area is loaded from the OSM API.
 
         Args:
             west (float): longitude of the bounding box in degree
@@ -45,23 +140,136 @@ class ElementsLoader:
         Returns:
             {Node}: dict of all OSM nodes. The keys are the IDs of the nodes.
         """
+        self.checkpoint()  # the store must know the latest edits before nodes are merged from it
+        bbox = (min(west, east), min(north, south), max(west, east), max(north, south))
+        loaded = self.store.area_loaded(*bbox)
+        if loaded is not None and loaded + config.element_store_max_age > time.time():
+            self.merge(self.store.query(*bbox), replace=False)
+            return self.elements
+
+        requests = lazy.requests()
+
+        if self.load_filter.strip():
+            raws = self.load_filtered(*bbox)
+            if raws is not None:
+                # the area is not complete, so it is not marked as loaded in the store
+                self.store.add_nodes(raws)
+                self.merge(self.store.query(*bbox))
+                return self.elements
+
         url = config.osm_api_url + "/api/0.6/map?bbox=${west},${north},${east},${south}"
         request = Template(url)
         request = request.substitute(west=west, north=north, east=east, south=south)
-        result = requests.get(request, headers=self.headers)
+        try:
+            result = requests.get(request, headers=self.headers)
+        except requests.exceptions.ConnectionError:
+            # offline editing with the nodes which were stored before
+            self.merge(self.store.query(*bbox), replace=False)
+            if loaded is None:
+                box = QMessageBox()
+                box.setWindowTitle("Offline")
+                box.setText("The OSM server cannot be reached and this area was not loaded before")
+                box.setIcon(QMessageBox.Icon.Warning)
+                box.exec()
+            return self.elements
 
         if result.ok:
             result_json = result.json()
-            nodes_copy = {raw["id"]: Node.Node(raw) for raw in result_json["elements"].copy() if raw["type"] == "node"}
-            self.elements_copy = {**self.elements_copy, **nodes_copy}
-            nodes = {raw["id"]: Node.Node(raw) for raw in result_json["elements"].copy() if raw["type"] == "node"}
-            self.elements = {**self.elements, **nodes}  # merge old and new nodes
+            raws = [raw for raw in result_json["elements"] if raw["type"] == "node"]
+            self.store.add_area(*bbox, raws)
+            self.merge(self.store.query(*bbox))
         else:
             box = QMessageBox()
             box.setWindowTitle("Error")
             box.setText("Maybe you have to zoom in because there are to many objects in this area")
             box.setIcon(QMessageBox.Icon.Warning)
             box.exec()
+        return self.elements
+
+    def load_filtered(self, west, south, east, north):
+        """ Load the nodes which match the load filter from the Overpass API. The answer is converted to the raw nodes
+        of the OSM API, so the same nodes are created.
+
+        Args:
+            west (float): longitude of the bounding box in degree
+            south (float): latitude of the bounding box in degree
+            east (float): longitude of the bounding box in degree
+            north (float): latitude of the bounding box in degree
+
+        Returns:
+            [dict]: raw nodes like in the answer of the OSM API. None if the Overpass API failed.
+        """
+        requests = lazy.requests()
+
+        query = self.overpass_query(self.load_filter, west, south, east, north)
+        try:
+            result = requests.post(config.overpass_url, data={"data": query}, headers=self.headers,
+                                   timeout=config.overpass_timeout + 5)
+            result.raise_for_status()
+            keys = ("id", "lat", "lon", "version", "changeset", "timestamp")
+            optional_keys = ("user", "uid", "tags")  # old anonymous edits have no user
+            raws = []
+            for element in result.json()["elements"]:
+                if element["type"] != "node":
+                    continue
+                raw = {key: element[key] for key in keys}
+                raw.update((key, element[key]) for key in optional_keys if key in element)
+                raw["type"] = "node"
+                raws.append(raw)
+        except (requests.exceptions.RequestException, ValueError, KeyError, TypeError):
+            return None
+        return raws
+
+    @staticmethod
+    def overpass_query(text, west, south, east, north):
+        """ Create an Overpass query for the nodes which match a filter in a bounding box. The filter has the syntax of
+        the queries of the TagIndex without prefixes of keys, e.g. "amenity=bench & !name" or "shop=bak*".
+
+        Args:
+            text (str): filter of the tags
+            west (float): longitude of the bounding box in degree
+            south (float): latitude of the bounding box in degree
+            east (float): longitude of the bounding box in degree
+            north (float): latitude of the bounding box in degree
+
+        Returns:
+            str: Overpass QL query which returns the nodes with their metadata as JSON
+        """
+        conditions = ""
+        for term in text.split("&"):
+            key, equal, value = term.partition("=")
+            key, value = key.strip(), value.strip()
+            if not key:
+                continue
+            if key.startswith("!"):
+                conditions += f"[!{json.dumps(key[1:].strip())}]"
+            elif not equal:
+                conditions += f"[{json.dumps(key)}]"
+            elif value.endswith("*"):
+                conditions += f"[{json.dumps(key)}~{json.dumps('^' + re.escape(value[:-1]))}]"
+            else:
+                conditions += f"[{json.dumps(key)}={json.dumps(value)}]"
+        return (f"[out:json][timeout:{config.overpass_timeout}];"
+                f"node{conditions}({south},{west},{north},{east});"
+                f"out meta;")
+
+    def merge(self, rows, replace=True):
+        """ Merge nodes of the store into the elements dicts.
+
+        Args:
+            rows ([(dict, dict, bool)]): pristine raw node, raw node with local edits and deletion flag
+            replace (bool): replace nodes which are already loaded
+        """
+        for pristine, local, deleted in rows:
+            node_id = (pristine or local)["id"]
+            if not replace and (node_id in self.elements_copy or node_id in self.elements):
+                continue
+            if pristine:
+                self.elements_copy[node_id] = Node.Node(pristine)
+            if deleted:
+                self.pop_node(node_id)
+            else:
+                self.put_node(Node.Node(local or pristine))
 
     def new_node(self, lat, lon):
         """ Add new node to the elements list.
@@ -70,9 +278,435 @@ class ElementsLoader:
             lat (float): latitude of the new node
             lon (float): longitude of the new node
         """
-        self.elements[self.new_node_counter] = Node.Node.create_new_node(self.new_node_counter, lat, lon)
+        self.edit(["c", self.new_node_counter, lat, lon])
         self.new_node_counter -= 1
 
+    def move_node(self, node_id, x, y):
+        """ Move a node to a new position.
+
+        Args:
+            node_id (int): id of the node
+            x (float): mercator x
+            y (float): mercator y
+        """
+        lat, lon = calc.xy2deg(x, y)
+        self.edit(["m", node_id, float(lat), float(lon)])
+
+    def set_coordinate(self, node_id, field, value):
+        """ Set the latitude or longitude of a node given as a text.
+
+        Args:
+            node_id (int): id of the node
+            field (str): "lat" or "lon"
+            value (str): new value
+
+        Returns:
+            bool: False if the value is not a valid coordinate
+        """
+        try:
+            value = float(value)
+        except ValueError:
+            return False
+        limit = 90 if field == "lat" else 180
+        if not math.isfinite(value) or not -limit <= value <= limit:
+            return False  # the node could not be projected
+        node = self.elements[node_id]
+        lat, lon = float(node.data["lat"]), float(node.data["lon"])
+        if field == "lat":
+            lat = value
+        else:
+            lon = value
+        self.edit(["m", node_id, lat, lon])
+        return True
+
+    def set_tag(self, node_id, key, value):
+        """ Add or change a tag of a node.
+
+        Args:
+            node_id (int): id of the node
+            key (str): tag key
+            value (str): tag value
+        """
+        self.edit(["t", node_id, key, value])
+
+    def remove_tag(self, node_id, key):
+        """ Remove a tag from a node.
+
+        Args:
+            node_id (int): id of the node
+            key (str): tag key
+        """
+        self.edit(["u", node_id, key])
+
+    def delete_node(self, node_id):
+        """ Delete a node.
+
+        Args:
+            node_id (int): id of the node
+        """
+        self.edit(["d", node_id])
+
+    def edit(self, record, undoable=True):
+        """ Apply an edit and append it to the journal. The edited nodes are saved in the store at the next
+        checkpoint.
+
+        Args:
+            record (list): edit in the format of the EditJournal
+            undoable (bool): remember the inverse edit to allow undo
+        """
+        if undoable:
+            inverse = self.inverse(record)
+            if inverse is not None:
+                self.remember(record, inverse)
+        self.apply(record)
+        self.journal.append(record)
+        self.dirty.add(record[1])
+        if len(self.dirty) >= config.journal_checkpoint_size:
+            self.checkpoint()
+
+    def inverse(self, record):
+        """ Create the edit which reverts an edit. It must be created before the edit is applied.
+
+        Args:
+            record (list): edit in the format of the EditJournal
+
+        Returns:
+            list: inverse edit. None if the edit changes nothing.
+        """
+        operation, node_id = record[0], record[1]
+        if operation == "c":
+            return ["d", node_id]
+        if node_id not in self.elements:
+            return None
+        node = self.elements[node_id]
+        if operation == "m":
+            return ["m", node_id, float(node.data["lat"]), float(node.data["lon"])]
+        if operation in ("t", "u"):
+            if record[2] in node.data["tags"]:
+                return ["t", node_id, record[2], node.data["tags"][record[2]]]
+            return ["u", node_id, record[2]]
+        return ["r", node_id, node.to_raw()]
+
+    def remember(self, record, inverse):
+        """ Put an edit on the undo stack. Moves of a node and changes of a tag which follow each other within a second
+        are merged into one step, e.g. typing a tag value or moving a node with the arrow keys.
+
+        Args:
+            record (list): edit in the format of the EditJournal
+            inverse (list): inverse edit
+        """
+        now = time.time()
+        self.redo_stack = []
+        if self.undo_stack:
+            last_record, last_inverse, last_time = self.undo_stack[-1]
+            same_node = last_record[0] == record[0] == "m" and last_record[1] == record[1]
+            same_tag = last_record[0] == record[0] == "t" and last_record[1:3] == record[1:3]
+            if (same_node or same_tag) and now - last_time < 1:
+                self.undo_stack[-1] = (record, last_inverse, now)
+                return
+        self.undo_stack.append((record, inverse, now))
+
+    def undo(self):
+        """ Revert the last edit.
+
+        Returns:
+            bool: False if there is nothing to undo
+        """
+        if not self.undo_stack:
+            return False
+        record, inverse, _ = self.undo_stack.pop()
+        self.edit(inverse, undoable=False)
+        self.redo_stack.append((record, inverse))
+        return True
+
+    def redo(self):
+        """ Apply the last reverted edit again.
+
+        Returns:
+            bool: False if there is nothing to redo
+        """
+        if not self.redo_stack:
+            return False
+        record, inverse = self.redo_stack.pop()
+        self.edit(record, undoable=False)
+        self.undo_stack.append((record, inverse, 0))
+        return True
+
+    def clear_history(self):
+        """ Forget all edits for undo and redo.
+        """
+        self.undo_stack.clear()
+        self.redo_stack = []
+
+    def apply(self, record):
+        """ Apply an edit to the elements. Edits are absolute, so applying one twice does not change the result.
+
+        Args:
+            record (list): edit in the format of the EditJournal
+        """
+        operation, node_id = record[0], record[1]
+        if operation == "c":
+            self.put_node(Node.Node.create_new_node(node_id, record[2], record[3]))
+            return
+        if operation == "r":
+            self.put_node(Node.Node(record[2]))
+            return
+        if node_id not in self.elements:
+            return
+        if operation == "d":
+            self.pop_node(node_id)
+            if self.selected_node == node_id:
+                self.selected_node = None
+            return
+
+        # the node is changed in place, so it is removed from the indices before and added again afterwards
+        node = self.elements[node_id]
+        for index in self.indices:
+            index.remove(node)
+        if operation == "m":
+            node.set_deg(record[2], record[3])
+        elif operation == "t":
+            node.data["tags"][record[2]] = record[3]
+            node.style_key = None
+        elif operation == "u":
+            node.data["tags"].pop(record[2], None)
+            node.style_key = None
+        for index in self.indices:
+            index.add(node)
+
+    def replay_journal(self):
+        """ Apply the edits of the journal which were not saved in the store before a crash. The time depends only on
+        the number of edits.
+        """
+        for record in self.journal.records():
+            node_id = record[1]
+            if node_id not in self.elements and node_id not in self.elements_copy:
+                stored = self.store.get(node_id)
+                if stored:
+                    self.merge([stored])
+            self.apply(record)
+            self.dirty.add(node_id)
+
+    def checkpoint(self):
+        """ Save all nodes edited since the last checkpoint in the store and clear the journal.
+        """
+        if not self.dirty:
+            return
+        raws = [self.elements[node_id].to_raw() for node_id in self.dirty if node_id in self.elements]
+        deleted_ids = [node_id for node_id in self.dirty if node_id not in self.elements]
+        self.store.save_edits(raws, deleted_ids)
+        self.journal.truncate()
+        self.dirty = set()
+
+    def acknowledge(self, results, changeset_id):
+        """ Apply the answer of the server for the uploaded nodes. Afterwards the nodes are not changes anymore. Nodes
+        which are not loaded anymore are only updated in the store.
+
+        Args:
+            results ([(int, int, int)]): old id, new id and new version of every uploaded node. The old id is the
+                placeholder id for new nodes, the new id and version are None if the node was deleted.
+            changeset_id (int): changeset of the upload
+        """
+        # the journal and the history must not contain edits of the uploaded nodes anymore
+        self.checkpoint()
+        self.clear_history()
+        acknowledged = []  # old id and raw node on the server for the store
+        for old_id, new_id, new_version in results:
+            self.elements_copy.pop(old_id, None)
+            node = self.pop_node(old_id)
+            if new_id is None:
+                acknowledged.append((old_id, None))
+                continue
+            if node is None:
+                # the node is not loaded anymore, the uploaded state is taken from the store
+                stored = self.store.get(old_id)
+                if stored is None or stored[1] is None:
+                    continue
+                raw = dict(stored[1], id=new_id, version=new_version, changeset=changeset_id)
+                acknowledged.append((old_id, raw))
+                continue
+
+            raw = node.to_raw()
+            raw.update(id=new_id, version=new_version, changeset=changeset_id)
+            self.elements_copy[new_id] = Node.Node(raw)
+            self.put_node(Node.Node(raw))
+            if self.selected_node == old_id:
+                self.selected_node = new_id
+            acknowledged.append((old_id, raw))
+        self.store.acknowledge(acknowledged)
+
+    def refresh(self, raws, deleted_ids):
+        """ Replace nodes by their current state on the server, e.g. after another user edited them. The local edits of
+        these nodes are lost.
+
+        Args:
+            raws ([dict]): raw nodes as they are on the server now
+            deleted_ids ([int]): ids of the nodes which were deleted on the server
+        """
+        # the journal and the history must not contain edits of the refreshed nodes anymore
+        self.checkpoint()
+        self.clear_history()
+        for raw in raws:
+            self.elements_copy[raw["id"]] = Node.Node(raw)
+            self.put_node(Node.Node(raw))
+        for node_id in deleted_ids:
+            self.elements_copy.pop(node_id, None)
+            self.pop_node(node_id)
+            if self.selected_node == node_id:
+                self.selected_node = None
+        self.store.acknowledge([(raw["id"], raw) for raw in raws] + [(node_id, None) for node_id in deleted_ids])
+
+    def revert_changes(self):
+        """ Throw away all local edits. The loaded nodes are reset to the state of the server without reloading them.
+        """
+        self.journal.truncate()
+        self.dirty = set()
+        self.clear_history()
+        self.store.discard_edits()
+        self.selected_node = None
+        self.new_node_counter = -1
+        self.reset_nodes({node_id: Node.Node(node.raw) for node_id, node in self.elements_copy.items()})
+
+    def discard(self):
+        """ Forget all loaded nodes and local edits, e.g. after the edits were uploaded. The stored areas are outdated
+        now and are loaded from the server again.
+        """
+        self.journal.truncate()
+        self.dirty = set()
+        self.clear_history()
+        self.store.discard_edits()
+        self.store.invalidate_areas()
+        self.clear()
+
+    def close(self):
+        """ This is triggered when the parent of the object is destroyed.
+        """
+        self.checkpoint()
+        self.journal.close()
+        self.store.close()
+
+    def show_clusters(self, viewer):
+        """ Check if the nodes are drawn as clusters in a view. Many nodes are clustered at low zoom levels.
+
+        Args:
+            viewer (Viewer): view to draw
+
+        Returns:
+            bool: draw clusters instead of nodes
+        """
+        return viewer.zoom <= self.clusters.max_zoom and len(self.elements) >= config.cluster_min_nodes
+
+    def get_clusters(self, viewer):
+        """ Get the clusters which are visible in a view.
+
+        Args:
+            viewer (Viewer): view to draw
+
+        Returns:
+            [(float, float, int)]: mercator x and y and number of nodes of every cluster
+        """
+        left, top = viewer.screen2xy(-config.cluster_radius, -config.cluster_radius)
+        right, bottom = viewer.screen2xy(viewer.frameGeometry().width() + config.cluster_radius,
+                                         viewer.frameGeometry().height() + config.cluster_radius)
+        return self.clusters.clusters(viewer.zoom, left, bottom, right, top)
+
+    @staticmethod
+    def cluster_radius(count):
+        """ Radius of the marker of a cluster.
+
+        Args:
+            count (int): number of nodes in the cluster
+
+        Returns:
+            float: radius in pixels
+        """
+        return 8 + 4 * math.log10(count)
+
+    def find_cluster(self, viewer, xscreen, yscreen):
+        """ Find the cluster of several nodes at a position of the view.
+
+        Args:
+            viewer (Viewer): view where the clusters are drawn
+            xscreen (float): x coordinate on view
+            yscreen (float): y coordinate on view
+
+        Returns:
+            (float, float, int): mercator x and y and number of nodes of the cluster. None if nodes are not clustered
+            or no cluster is at the position.
+        """
+        if not self.show_clusters(viewer):
+            return None
+        for x, y, count in self.get_clusters(viewer):
+            if count > 1:
+                cluster_x, cluster_y = viewer.xy2screen(x, y)
+                if math.hypot(cluster_x - xscreen, cluster_y - yscreen) <= self.cluster_radius(count):
+                    return x, y, count
+        return None
+
+    def draw_clusters(self, viewer, qpainter):
+        """ Draw the clusters with the number of their nodes. Single nodes are drawn with the default style.
+
+        Args:
+            viewer (Viewer): object which must is drawn on and which must be updated
+            qpainter (QPainter): object which is used to draw
+        """
+        single_nodes = []
+        qpainter.setBrush(self.cluster_brush)
+        qpainter.setPen(self.cluster_pen)
+        qpainter.setFont(self.cluster_font)
+        for x, y, count in self.get_clusters(viewer):
+            xscreen, yscreen = viewer.xy2screen(x, y)
+            if count == 1:
+                single_nodes.append(QPointF(xscreen, yscreen))
+                continue
+            radius = self.cluster_radius(count)
+            rect = QtCore.QRectF(xscreen - radius, yscreen - radius, 2 * radius, 2 * radius)
+            qpainter.drawEllipse(rect)
+            qpainter.drawText(rect, QtCore.Qt.AlignCenter, str(count))
+        self.styles.style((), viewer.zoom).draw(qpainter, single_nodes)
+
+    def search(self, query):
+        """ Search nodes by their tags. The found nodes are highlighted until the query changes.
+
+        Args:
+            query (str): query of the TagIndex, an empty query finds nothing
+
+        Returns:
+            set: ids of the found nodes
+        """
+        self.search_query = query.strip()
+        return self.get_highlighted()
+
+    def get_highlighted(self):
+        """ Get the nodes found by the current search. The search is repeated if the tags changed.
+
+        Returns:
+            set: ids of the found nodes
+        """
+        query, version, ids = self.search_result
+        if query != self.search_query or version != self.tag_index.version:
+            ids = self.tag_index.query(self.search_query) if self.search_query else set()
+            self.search_result = (self.search_query, self.tag_index.version, ids)
+        return ids
+
+    def draw_highlighted(self, viewer, qpainter):
+        """ Draw a ring around the visible nodes found by a search.
+
+        Args:
+            viewer (Viewer): object which must is drawn on and which must be updated
+            qpainter (QPainter): object which is used to draw
+        """
+        qpainter.setBrush(QColor(0, 0, 0, 0))
+        qpainter.setPen(self.highlight_pen)
+        width, height = viewer.frameGeometry().width(), viewer.frameGeometry().height()
+        size = 14
+        for node_id in self.get_highlighted():
+            if node_id not in self.elements:
+                continue
+            xscreen, yscreen = viewer.xy2screen(self.elements[node_id].x, self.elements[node_id].y)
+            if -size <= xscreen <= width + size and -size <= yscreen <= height + size:
+                qpainter.drawEllipse(QtCore.QRectF(xscreen - size / 2, yscreen - size / 2, size, size))
+
     def draw(self, viewer, qpainter, alpha):
         """ Function to draw on a View.
 
@@ -82,18 +716,31 @@ class ElementsLoader:
             alpha (float): opacity to draw
         """
         qpainter.setOpacity(alpha)
+        if self.show_clusters(viewer):
+            self.draw_clusters(viewer, qpainter)  # single found nodes are not visible
+            return
+
+        width, height = viewer.frameGeometry().width(), viewer.frameGeometry().height()
+        margin = 20  # nodes at the border of the view are drawn partially
+
+        # group the visible nodes by their style, the style of a node is only evaluated again after its tags changed
+        groups = defaultdict(list)
         for elem in self.elements.values():
-            qpainter.setBrush(QColor(QtCore.Qt.blue))
-            qpainter.setPen(QPen(QColor(QtCore.Qt.black), 1))
-            if elem.data["type"] == "node":
-                x, y = calc.deg2xy(float(elem.data["lat"]), float(elem.data["lon"]))
-                xscreen, yscreen = viewer.xy2screen(x, y)
-
-                size = 6
-                qpainter.drawEllipse(xscreen - size / 2, yscreen - size / 2, size, size)
-
-                if self.selected_node and elem.id == self.selected_node:
-                    qpainter.setBrush(QColor(0, 0, 0, 0))
-                    qpainter.setPen(QPen(QColor(QtCore.Qt.red), 2))
-                    size = 10
-                    qpainter.drawRect(xscreen - size / 2, yscreen - size / 2, size, size)
+            xscreen = (elem.x - viewer.x) * viewer.scale_x + width / 2
+            yscreen = -(elem.y - viewer.y) * viewer.scale_y + height / 2
+            if -margin <= xscreen <= width + margin and -margin <= yscreen <= height + margin:
+                if elem.style_key is None:
+                    elem.style_key = self.styles.classify(elem.data["tags"])
+                groups[elem.style_key].append(QPointF(xscreen, yscreen))
+
+        for key, points in groups.items():
+            self.styles.style(key, viewer.zoom).draw(qpainter, points)
+        self.draw_highlighted(viewer, qpainter)
+
+        if self.selected_node in self.elements:
+            elem = self.elements[self.selected_node]
+            xscreen, yscreen = viewer.xy2screen(elem.x, elem.y)
+            qpainter.setBrush(QColor(0, 0, 0, 0))
+            qpainter.setPen(QPen(QColor(QtCore.Qt.red), 2))
+            size = 10
+            qpainter.drawRect(xscreen - size / 2, yscreen - size / 2, size, size)
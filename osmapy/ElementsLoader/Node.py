@@ -1,8 +1,6 @@
 # -*- coding: utf-8 -*-
 
-import lxml.etree as ET
-
-from osmapy.utils import calc
+from osmapy.utils import calc, lazy
 
 
 class Node:
@@ -19,8 +17,8 @@ class Node:
         self.id = self.raw["id"]
 
         self.data = dict(id=str(self.raw["id"]),
-                         uid=str(self.raw["uid"]),
-                         user=str(self.raw["user"]),
+                         uid=str(self.raw.get("uid", "")),  # missing for old anonymous edits
+                         user=str(self.raw.get("user", "")),
                          version=str(self.raw["version"]),
                          changeset=str(self.raw["changeset"]),
                          timestamp=str(self.raw["timestamp"]),
@@ -35,6 +33,7 @@ class Node:
 
         self.x, self.y = calc.deg2xy(self.raw["lat"], self.raw["lon"])
         self.trigger = False
+        self.style_key = None  # rules of the StyleEngine which match the tags, None if the tags changed
 
     @classmethod
     def create_new_node(cls, id, lat, lon):
@@ -67,6 +66,8 @@ class Node:
             id (int): id which should be shown in the XML
             tags (bool): the tags should be omitted when deleting a node
         """
+        ET = lazy.etree()
+
         if not changeset:
             changeset = self.data["changeset"]
 
@@ -95,16 +96,41 @@ class Node:
         lat, lon = calc.xy2deg(x, y)
         self.data["lat"], self.data["lon"] = str(lat), str(lon)
 
+    def set_deg(self, lat, lon):
+        """ Set new position of node
+
+        Args:
+            lat (float): latitude in degree
+            lon (float): longitude in degree
+        """
+        self.x, self.y = calc.deg2xy(lat, lon)
+        self.data["lat"], self.data["lon"] = str(lat), str(lon)
+
+    def to_raw(self):
+        """ Raw dictionary of the current state of the node. It has the same format as the OSM server answer, so a node
+        can be restored from it.
+
+        Returns:
+            dict: raw node
+        """
+        raw = self.raw.copy()
+        raw["lat"] = float(self.data["lat"])
+        raw["lon"] = float(self.data["lon"])
+        raw["tags"] = self.data["tags"].copy()
+        return raw
+
     def __str__(self):
         """ XML representation of the node.
 
         Returns:
             str: XML representation as a string
         """
+        ET = lazy.etree()
+
         return ET.tostring(self.create_xml(self.id)).decode()
 
     def __eq__(self, other):
-        """ Compare two node objects, by their string XML representation.
+        """ Compare two node objects, by the fields of their XML representation.
 
         Args:
             other (Node): node to compare
@@ -112,10 +138,12 @@ class Node:
         Returns:
             bool
         """
-        return ET.tostring(self.create_xml(1)).decode() == ET.tostring(other.create_xml(1)).decode()
+        fields = ("changeset", "version", "lat", "lon")
+        return all(str(self.data[field]) == str(other.data[field]) for field in fields) \
+            and self.data["tags"] == other.data["tags"]
 
     def __ne__(self, other):
-        """ Compare two node objects, by their string XML representation.
+        """ Compare two node objects, by the fields of their XML representation.
 
         Args:
             other (Node): node to compare
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+""" Styles of the nodes defined by a small subset of MapCSS in the configuration file, e.g.
+
+    node[amenity=bench] { color: #8b4513; size: 8; }
+    node|z-16[shop] { color: purple; size: 4; }
+    node[!name] { outline: red; width: 2; }
+
+A selector matches nodes by their tags ([key], [!key], [key=value], [key!=value]) and optionally by the zoom level of
+the view (|z17, |z15-, |z-16, |z15-17). The declarations color, outline, size, width (of the outline) and shape
+(circle or square) override the default style. Like in MapCSS all matching rules are applied in their order.
+
+The rules are compiled once. The rules which match the tags of a node are cached in the node until its tags change, so
+the nodes are grouped by their style without evaluating the rules in every frame.
+"""
+
+import re
+
+from PySide2 import QtCore
+from PySide2.QtGui import QColor, QPen, QPolygonF
+
+from osmapy.utils.config import ConfigError
+
+rule_pattern = re.compile(r"^\s*node(?:\|z(?P<min_zoom>\d*)(?P<range>-?)(?P<max_zoom>\d*))?"
+                          r"(?P<conditions>(?:\[[^\]]+\])*)\s*\{(?P<declarations>[^}]*)\}\s*$")
+condition_pattern = re.compile(r"\[\s*(?P<negation>!?)\s*(?P<key>[^=!\]\s]+)\s*"
+                               r"(?:(?P<operator>!?=)\s*(?P<value>[^\]]*?)\s*)?\]")
+declarations = {"color", "outline", "size", "width", "shape"}
+
+
+class StyleRule:
+    """ A compiled rule with the conditions on the tags, the zoom range and the declarations.
+    """
+
+    def __init__(self, text):
+        """ Parse a rule.
+
+        Args:
+            text (str): rule in the MapCSS subset
+
+        Raises:
+            ConfigError: if the rule is not valid
+        """
+        match = rule_pattern.match(text)
+        if not match:
+            raise ConfigError(f"The node style \"{text}\" is not valid.")
+
+        self.min_zoom = int(match["min_zoom"]) if match["min_zoom"] else 0
+        if match["range"]:
+            self.max_zoom = int(match["max_zoom"]) if match["max_zoom"] else 99
+        else:
+            self.max_zoom = self.min_zoom if match["min_zoom"] else 99
+
+        self.conditions = []  # (key, value or None, negated)
+        conditions = list(condition_pattern.finditer(match["conditions"]))
+        if "".join(condition.group(0) for condition in conditions) != match["conditions"]:
+            raise ConfigError(f"The conditions of the node style \"{text}\" are not valid.")
+        for condition in conditions:
+            if condition["operator"]:
+                self.conditions.append((condition["key"], condition["value"], condition["operator"] == "!="))
+            else:
+                self.conditions.append((condition["key"], None, bool(condition["negation"])))
+
+        self.declarations = dict()
+        for declaration in match["declarations"].split(";"):
+            if not declaration.strip():
+                continue
+            name, _, value = declaration.partition(":")
+            name, value = name.strip(), value.strip()
+            if name not in declarations or not value:
+                raise ConfigError(f"The declaration \"{declaration.strip()}\" of the node style \"{text}\" "
+                                  f"is not valid.")
+            if name in ("size", "width"):
+                try:
+                    value = float(value)
+                except ValueError:
+                    raise ConfigError(f"The {name} of the node style \"{text}\" must be a number.")
+            elif name in ("color", "outline") and not QColor.isValidColor(value):
+                raise ConfigError(f"The {name} of the node style \"{text}\" is not a valid color.")
+            elif name == "shape" and value not in ("circle", "square"):
+                raise ConfigError(f"The shape of the node style \"{text}\" must be circle or square.")
+            self.declarations[name] = value
+
+    def matches(self, tags):
+        """ Check the conditions on the tags.
+
+        Args:
+            tags (dict): tags of a node
+
+        Returns:
+            bool: all conditions are fulfilled
+        """
+        for key, value, negated in self.conditions:
+            if value is None:
+                fulfilled = key in tags
+            else:
+                fulfilled = tags.get(key) == value
+            if fulfilled == negated:
+                return False
+        return True
+
+
+class NodeStyle:
+    """ Resolved style of a group of nodes with prebuilt pens, so a group is drawn with two calls.
+    """
+
+    def __init__(self, color="blue", outline="black", size=6, width=1, shape="circle"):
+        """
+        Args:
+            color (str): fill color
+            outline (str): color of the outline
+            size (float): diameter of the node in pixels
+            width (float): width of the outline in pixels
+            shape (str): circle or square
+        """
+        cap = QtCore.Qt.RoundCap if shape == "circle" else QtCore.Qt.SquareCap
+        self.size = size
+        self.fill_pen = QPen(QColor(color), size, QtCore.Qt.SolidLine, cap)
+        self.outline_pen = QPen(QColor(outline), size + 2 * width, QtCore.Qt.SolidLine, cap) if width > 0 else None
+
+    def draw(self, qpainter, points):
+        """ Draw a group of nodes.
+
+        Args:
+            qpainter (QPainter): object which is used to draw
+            points ([QPointF]): positions of the nodes on the view
+        """
+        polygon = QPolygonF(points)
+        if self.outline_pen is not None:
+            qpainter.setPen(self.outline_pen)
+            qpainter.drawPoints(polygon)
+        qpainter.setPen(self.fill_pen)
+        qpainter.drawPoints(polygon)
+
+
+class StyleEngine:
+    """ Compiled rules and the cache of the resolved styles.
+    """
+
+    def __init__(self, rules):
+        """
+        Args:
+            rules ([str]): rules in the MapCSS subset
+
+        Raises:
+            ConfigError: if a rule is not valid
+        """
+        self.rules = [StyleRule(rule) for rule in rules]
+        self.styles = dict()  # resolved styles by the matching rules and the zoom level
+
+    def classify(self, tags):
+        """ Find the rules which match the tags of a node. The zoom level is considered when the style is resolved.
+
+        Args:
+            tags (dict): tags of a node
+
+        Returns:
+            tuple: indices of the matching rules, used as key of the style
+        """
+        return tuple(i for i, rule in enumerate(self.rules) if rule.matches(tags))
+
+    def style(self, key, zoom):
+        """ Resolve the style of the nodes which match some rules at a zoom level.
+
+        Args:
+            key (tuple): result of classify()
+            zoom (int): zoom level of the view
+
+        Returns:
+            NodeStyle: style of the nodes
+        """
+        if (key, zoom) not in self.styles:
+            values = dict()
+            for i in key:
+                if self.rules[i].min_zoom <= zoom <= self.rules[i].max_zoom:
+                    values.update(self.rules[i].declarations)
+            self.styles[(key, zoom)] = NodeStyle(**values)
+        return self.styles[(key, zoom)]
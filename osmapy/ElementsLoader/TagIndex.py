@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+
+
+class TagIndex:
+    """ Inverted index of the tags of the nodes. It maps every key and every key=value pair to the ids of the nodes with
+    this tag. The keys and the tags are also kept sorted, so prefix queries are answered with a binary search. The cost
+    of a query depends on the number of matching nodes, not on the number of loaded nodes.
+
+    Queries are terms joined by "&", all terms must match:
+        key         nodes with the key
+        !key        nodes without the key
+        key=value   nodes with the tag
+        key=val*    nodes with the key and a value starting with val
+        ke*         nodes with a key starting with ke
+    """
+
+    def __init__(self):
+        self.by_key = dict()  # key -> ids
+        self.by_tag = dict()  # (key, value) -> ids
+        self.keys = []  # sorted keys
+        self.tags = []  # sorted (key, value) pairs
+        self.indexed = dict()  # id -> indexed tags, so a node can be removed after its tags changed
+        self.version = 0  # changed with every change of the index, to find outdated query results
+
+    def __len__(self):
+        return len(self.indexed)
+
+    def add(self, node):
+        """ Add the tags of a node.
+
+        Args:
+            node (Node): node to add
+        """
+        tags = dict(node.data["tags"])
+        self.indexed[node.id] = tags
+        self.version += 1
+        for key, value in tags.items():
+            if key not in self.by_key:
+                self.by_key[key] = set()
+                bisect.insort(self.keys, key)
+            self.by_key[key].add(node.id)
+            if (key, value) not in self.by_tag:
+                self.by_tag[(key, value)] = set()
+                bisect.insort(self.tags, (key, value))
+            self.by_tag[(key, value)].add(node.id)
+
+    def remove(self, node):
+        """ Remove the tags of a node as they were indexed.
+
+        Args:
+            node (Node): node to remove
+        """
+        self.version += 1
+        for key, value in self.indexed.pop(node.id, dict()).items():
+            self.by_key[key].discard(node.id)
+            if not self.by_key[key]:
+                del self.by_key[key]
+                del self.keys[bisect.bisect_left(self.keys, key)]
+            self.by_tag[(key, value)].discard(node.id)
+            if not self.by_tag[(key, value)]:
+                del self.by_tag[(key, value)]
+                del self.tags[bisect.bisect_left(self.tags, (key, value))]
+
+    def clear(self):
+        """ Remove all nodes.
+        """
+        version = self.version
+        self.__init__()
+        self.version = version + 1
+
+    def query(self, text):
+        """ Find the nodes which match a query.
+
+        Args:
+            text (str): query, see the description of the class
+
+        Returns:
+            set: ids of the matching nodes
+        """
+        terms = [term.strip() for term in text.split("&") if term.strip()]
+        # the terms which select nodes are evaluated first, missing keys only remove nodes
+        terms.sort(key=lambda term: term.startswith("!"))
+        result = None
+        for term in terms:
+            if term.startswith("!"):
+                ids = self.by_key.get(term[1:].strip(), set())
+                result = (set(self.indexed) if result is None else result) - ids
+                continue
+            ids = self.match(term)
+            result = ids if result is None else result & ids
+            if not result:
+                break
+        return set() if result is None else set(result)
+
+    def match(self, term):
+        """ Find the nodes which match a single term without negation.
+
+        Args:
+            term (str): key, key=value, key=prefix* or prefix*
+
+        Returns:
+            set: ids of the matching nodes, must not be modified
+        """
+        key, equal, value = term.partition("=")
+        key, value = key.strip(), value.strip()
+        if not equal:
+            if key.endswith("*"):
+                prefix = key[:-1]
+                start = bisect.bisect_left(self.keys, prefix)
+                end = bisect.bisect_left(self.keys, prefix + "\U0010ffff")
+                return set().union(*(self.by_key[key] for key in self.keys[start:end]))
+            return self.by_key.get(key, set())
+        if value.endswith("*"):
+            prefix = value[:-1]
+            start = bisect.bisect_left(self.tags, (key, prefix))
+            end = bisect.bisect_left(self.tags, (key, prefix + "\U0010ffff"))
+            return set().union(*(self.by_tag[tag] for tag in self.tags[start:end]))
+        return self.by_tag.get((key, value), set())
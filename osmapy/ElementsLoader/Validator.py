@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+import math
+
+metres_per_degree = 6378137 * math.pi / 180  # length of one degree of longitude at the equator
+
+
+def check_tags(tags):
+    """ Find suspicious keys and values of the tags of a node.
+
+    Args:
+        tags (dict): tags of a node
+
+    Returns:
+        [str]: descriptions of the problems
+    """
+    problems = []
+    for key, value in tags.items():
+        if not value:
+            problems.append(f"Tag \"{key}\" has an empty value")
+        elif value != value.strip():
+            problems.append(f"Value of \"{key}\" starts or ends with a space")
+        elif len(value) > 255:
+            problems.append(f"Value of \"{key}\" is longer than 255 characters")
+        if key != key.strip() or " " in key:
+            problems.append(f"Key \"{key}\" contains a space")
+        if key.lower() == "fixme":
+            problems.append(f"Node is marked with \"{key}={value}\"")
+    return problems
+
+
+class Validator:
+    """ Validation of the nodes which is updated with every change of a node like the other indices of the
+    ElementsLoader. Nodes are checked for duplicates within a distance, new nodes without tags and suspicious tags.
+
+    The duplicates are found with a grid in mercator coordinates. The distance is measured in local metres, the scale
+    of the mercator projection at the latitude of the nodes is considered. The cells are as large as the distance at
+    60 degree latitude, so up to there only the neighbouring cells are searched.
+    """
+
+    def __init__(self, distance=1.0):
+        """
+        Args:
+            distance (float): nodes closer than this distance in metres are duplicates
+        """
+        self.distance = distance
+        self.cell_size = distance * 2 / metres_per_degree  # cos(60 degree) = 0.5
+        self.grid = dict()  # cell -> ids of the nodes in the cell
+        self.positions = dict()  # indexed position of every node, so a node can be removed after it moved
+        self.duplicates = dict()  # id -> ids of the nodes which are too close
+        self.problems = dict()  # id -> descriptions of the problems of the tags
+        self.version = 0  # changed with every change of the results, to find outdated lists
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, node):
+        """ Validate a node and add it to the grid.
+
+        Args:
+            node (Node): node to add
+        """
+        x, y = node.x, node.y
+        self.version += 1
+        self.positions[node.id] = (x, y)
+
+        problems = check_tags(node.data["tags"]) if node.data["tags"] else []
+        if node.id < 0 and not node.data["tags"]:
+            problems.append("New node without tags")
+        if problems:
+            self.problems[node.id] = problems
+
+        # metres per mercator degree at the latitude of the node, mercator y is in degree
+        scale = metres_per_degree / math.cosh(y * math.pi / 180)
+        limit = (self.distance / scale) ** 2
+        cell_x, cell_y = math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+        reach = max(1, math.ceil(self.distance / scale / self.cell_size))
+        for i in range(cell_x - reach, cell_x + reach + 1):
+            for j in range(cell_y - reach, cell_y + reach + 1):
+                cell = self.grid.get((i, j))
+                if cell is None:
+                    continue
+                for other in cell:
+                    other_x, other_y = self.positions[other]
+                    if (other_x - x) ** 2 + (other_y - y) ** 2 < limit:
+                        self.duplicates.setdefault(node.id, set()).add(other)
+                        self.duplicates.setdefault(other, set()).add(node.id)
+
+        cell = self.grid.get((cell_x, cell_y))
+        if cell is None:
+            self.grid[(cell_x, cell_y)] = {node.id}
+        else:
+            cell.add(node.id)
+
+    def remove(self, node):
+        """ Remove a node and its results. The position is taken from the grid, so it can be removed after it moved.
+
+        Args:
+            node (Node): node to remove
+        """
+        if node.id not in self.positions:
+            return
+        self.version += 1
+        x, y = self.positions.pop(node.id)
+        key = (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+        self.grid[key].discard(node.id)
+        if not self.grid[key]:
+            del self.grid[key]
+        self.problems.pop(node.id, None)
+        for other in self.duplicates.pop(node.id, ()):
+            self.duplicates[other].discard(node.id)
+            if not self.duplicates[other]:
+                del self.duplicates[other]
+
+    def clear(self):
+        """ Remove all nodes.
+        """
+        version = self.version
+        self.__init__(self.distance)
+        self.version = version + 1
+
+    def issues(self, node_id):
+        """ Get the problems of a node.
+
+        Args:
+            node_id (int): id of the node
+
+        Returns:
+            [str]: descriptions of the problems
+        """
+        issues = list(self.problems.get(node_id, []))
+        for other in sorted(self.duplicates.get(node_id, ())):
+            issues.append(f"Duplicate of node {other}")
+        return issues
+
+    def invalid(self):
+        """ Get the ids of all nodes with problems.
+
+        Returns:
+            set: ids of the nodes
+        """
+        return set(self.problems) | set(self.duplicates)
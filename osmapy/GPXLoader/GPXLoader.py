@@ -1,32 +1,174 @@
-import gpxpy
+import re
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
 from PySide2 import QtCore
-from PySide2.QtCore import QLine
+from PySide2.QtCore import QLineF, QObject, Signal
 from PySide2.QtGui import QColor, QPen
 
-from osmapy.utils.Point import Point
+from osmapy.GPXLoader.TrackIndex import TrackIndex
+from osmapy.GPXLoader.TrackPyramid import TrackPyramid
+from osmapy.utils import calc, lazy
+from osmapy.utils.config import config
+
+offset_pattern = re.compile(r"([+-])(\d\d):?(\d\d)$")
+
+
+def utc_time(text):
+    """ Convert the time of a track point to UTC. Fractions of seconds are removed, seconds are precise enough.
+
+    Args:
+        text (str): time in the ISO 8601 format of GPX, e.g. 2020-01-01T12:00:00Z or 2020-01-01T14:00:00.5+02:00
+
+    Returns:
+        str: UTC time without timezone, "NaT" if the time is missing
+    """
+    if not text:
+        return "NaT"
+    text = text.strip()
+    offset = offset_pattern.search(text[19:])
+    if offset is None:
+        return text[:19]  # "Z" or no timezone, GPX times are UTC by definition
+    sign, hours, minutes = offset.groups()
+    delta = timedelta(hours=int(hours), minutes=int(minutes))
+    time = datetime.strptime(text[:19], "%Y-%m-%dT%H:%M:%S")
+    return (time - delta if sign == "+" else time + delta).isoformat()
+
+
+def parse_gpx(path, chunk_size=10000):
+    """ Parse the track points of a GPX file with a streaming XML parser. The parsed elements are freed immediately, so
+    the memory does not depend on the size of the file. Track segments are separated by a point with NaN coordinates.
+
+    Args:
+        path (pathlib.Path): path to the gpx file
+        chunk_size (int): number of points per chunk
+
+    Yields:
+        (np.ndarray, np.ndarray, np.ndarray): mercator x, mercator y and the time of the points as datetime64
+    """
+    ET = lazy.etree()
+
+    lats, lons, times = [], [], []
+    for _, element in ET.iterparse(str(path), events=("end",), tag=("{*}trkpt", "{*}trkseg"), huge_tree=True):
+        if element.tag.endswith("trkseg"):
+            lats.append(np.nan)
+            lons.append(np.nan)
+            times.append("NaT")
+        else:
+            lats.append(float(element.get("lat")))
+            lons.append(float(element.get("lon")))
+            times.append(utc_time(element.findtext("{*}time")))
+        # free the parsed elements
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+        if len(lats) >= chunk_size:
+            yield _to_arrays(lats, lons, times)
+            lats, lons, times = [], [], []
+    if lats:
+        yield _to_arrays(lats, lons, times)
+
+
+def _to_arrays(lats, lons, times):
+    x, y = calc.deg2xy(np.array(lats), np.array(lons))
+    return x, y, np.array(times, dtype="datetime64[s]")
+
+
+class GPXLoader(QObject):
+    """ Class to manage GPX information. The file is parsed in a background thread and the track is shown while it is
+    loading. The track is drawn from a TrackPyramid with a simplified copy for every zoom level. Only the chunks of the
+    track inside of the view are drawn.
+    """
 
+    progress = Signal()  # new points were added
+    failed = Signal(str)  # loading stopped with an error message
 
-class GPXLoader:
     def __init__(self, path):
-        """ Class to manage GPX information.
+        """ Prepare loading a GPX file. The loading begins with start().
 
         Args:
             path (pathlib.Path): path to the gpx file
 
         """
-        self.points = []
+        super(GPXLoader, self).__init__()
+        self.path = path
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.time = np.empty(0, dtype="datetime64[s]")
+        self.pyramid = TrackPyramid(self.x, self.y, config.max_zoom)
+        self.index = TrackIndex(self.x, self.y)  # full resolution to find track points
+        self.finished = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        """ Start the loading in the background. The signals should be connected before.
+        """
+        threading.Thread(target=self.worker, daemon=True).start()
+
+    def worker(self):
+        """ Worker which parses the file chunk by chunk. The chunks are appended to the track and the pyramid is rebuilt
+        whenever the track has grown by a quarter, so the total work stays linear in the number of points.
+        """
         try:
-            with open(path, "r") as gpx_file:
-                gpx = gpxpy.parse(gpx_file)
-                self.points = []
-                for track in gpx.tracks:
-                    for segment in track.segments:
-                        for point in segment.points:
-                            point = Point(point.latitude, point.longitude)
-                            self.points.append(point)
+            chunks = []  # parsed chunks which are not appended yet
+            size = 0
+            for chunk in parse_gpx(self.path):
+                chunks.append(chunk)
+                size += len(chunk[0])
+                if size >= 0.25 * len(self.x):
+                    self.append(chunks)
+                    self.build_index()
+                    self.progress.emit()
+                    chunks, size = [], 0
+            if chunks:
+                self.append(chunks)
+                self.build_index()
+            self.progress.emit()
         except Exception as e:
-            # TODO error handling
-            print(e)
+            self.failed.emit(f"{self.path}:\n{e}")
+        finally:
+            self.finished = True
+
+    def append(self, chunks):
+        """ Append parsed chunks to the track. The track is copied once for all chunks.
+
+        Args:
+            chunks ([(np.ndarray, np.ndarray, np.ndarray)]): mercator x, mercator y and time of the points
+        """
+        with self.lock:
+            self.x = np.concatenate([self.x] + [chunk[0] for chunk in chunks])
+            self.y = np.concatenate([self.y] + [chunk[1] for chunk in chunks])
+            self.time = np.concatenate([self.time] + [chunk[2] for chunk in chunks])
+
+    def build_index(self):
+        """ Build the pyramid and the index of the points loaded so far.
+        """
+        with self.lock:
+            x, y = self.x, self.y
+        self.pyramid = TrackPyramid(x, y, config.max_zoom)
+        self.index = TrackIndex(x, y)
+
+    def nearest_point(self, viewer, xscreen, yscreen, max_distance=8):
+        """ Find the track point which is the nearest to a position on the view.
+
+        Args:
+            viewer (Viewer): view of the position
+            xscreen (float): x coordinate on view
+            yscreen (float): y coordinate on view
+            max_distance (float): maximum distance in pixels
+
+        Returns:
+            (float, float, np.datetime64): mercator x, y and time of the point. None if there is no point near.
+        """
+        index = self.index
+        x, y = viewer.screen2xy(xscreen, yscreen)
+        i = index.nearest(x, y, max_distance / viewer.scale_x)
+        if i is None:
+            return None
+        with self.lock:
+            return index.x[i], index.y[i], self.time[i]
 
     def draw(self, viewer, qpainter, alpha):
         """ Function to draw on a View.
@@ -40,9 +182,15 @@ class GPXLoader:
         qpainter.setBrush(QColor(QtCore.Qt.red))
         qpainter.setPen(QPen(QColor(QtCore.Qt.red), 2, QtCore.Qt.SolidLine, QtCore.Qt.RoundCap, QtCore.Qt.RoundJoin))
 
-        points = [viewer.xy2screen(point.x, point.y) for point in self.points]
-        pointsA = points[:-1]
-        pointsB = points[1:]
+        left, top = viewer.screen2xy(0, 0)
+        right, bottom = viewer.screen2xy(viewer.frameGeometry().width(), viewer.frameGeometry().height())
+        x, y = self.pyramid.get_level(viewer.zoom).select(left, bottom, right, top)
+        xscreen, yscreen = viewer.xy2screen(x, y)
+        # no lines between segments
+        valid = ~np.isnan(xscreen)
+        valid = np.flatnonzero(valid[:-1] & valid[1:])
 
-        lines = [QLine(pointA[0], pointA[1], pointB[0], pointB[1]) for pointA, pointB in zip(pointsA, pointsB)]
+        lines = [QLineF(xa, ya, xb, yb) for xa, ya, xb, yb in
+                 zip(xscreen[valid].tolist(), yscreen[valid].tolist(),
+                     xscreen[valid + 1].tolist(), yscreen[valid + 1].tolist())]
         qpainter.drawLines(lines)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+class TrackIndex:
+    """ Spatial index of a track. The track is split into chunks of consecutive points and the mercator bounding box of
+    every chunk is precomputed, so only the chunks inside of a bounding box have to be processed.
+    """
+
+    def __init__(self, x, y, chunk_size=256):
+        """ Split the track into chunks and compute the bounding boxes.
+
+        Args:
+            x (np.ndarray): mercator x of the points, segments are separated by NaN
+            y (np.ndarray): mercator y of the points, segments are separated by NaN
+            chunk_size (int): number of points per chunk
+        """
+        self.x = x
+        self.y = y
+        self.chunk_size = chunk_size
+        # every chunk also contains the first point of the next chunk to draw the connecting line
+        padding = np.full(chunk_size + 1, np.nan)
+        self.x_padded = np.concatenate((x, padding))
+        self.y_padded = np.concatenate((y, padding))
+
+        num_chunks = -(-len(x) // chunk_size)
+        self.offsets = np.arange(chunk_size + 1)
+        indices = np.arange(num_chunks)[:, None] * chunk_size + self.offsets[None, :]
+        # fmin and fmax ignore the NaN separators
+        self.left = np.fmin.reduce(self.x_padded[indices], axis=1) if num_chunks else np.empty(0)
+        self.right = np.fmax.reduce(self.x_padded[indices], axis=1) if num_chunks else np.empty(0)
+        self.bottom = np.fmin.reduce(self.y_padded[indices], axis=1) if num_chunks else np.empty(0)
+        self.top = np.fmax.reduce(self.y_padded[indices], axis=1) if num_chunks else np.empty(0)
+
+    def query(self, left, bottom, right, top):
+        """ Find the chunks which intersect a bounding box.
+
+        Args:
+            left (float): mercator x of the bounding box
+            bottom (float): mercator y of the bounding box
+            right (float): mercator x of the bounding box
+            top (float): mercator y of the bounding box
+
+        Returns:
+            np.ndarray: numbers of the chunks
+        """
+        return np.flatnonzero((self.left <= right) & (self.right >= left) & (self.bottom <= top) & (self.top >= bottom))
+
+    def select(self, left, bottom, right, top):
+        """ Get the points of all chunks which intersect a bounding box. The chunks are separated by NaN points.
+
+        Args:
+            left (float): mercator x of the bounding box
+            bottom (float): mercator y of the bounding box
+            right (float): mercator x of the bounding box
+            top (float): mercator y of the bounding box
+
+        Returns:
+            (np.ndarray, np.ndarray): mercator x and y of the points
+        """
+        chunks = self.query(left, bottom, right, top)
+        indices = chunks[:, None] * self.chunk_size + self.offsets[None, :]
+        # one extra index per chunk points to the NaN padding and separates the chunks
+        separators = np.full((len(chunks), 1), len(self.x))
+        indices = np.concatenate((indices, separators), axis=1).ravel()
+        return self.x_padded[indices], self.y_padded[indices]
+
+    def nearest(self, x, y, max_distance):
+        """ Find the point which is the nearest to a position.
+
+        Args:
+            x (float): mercator x of the position
+            y (float): mercator y of the position
+            max_distance (float): only points within this distance in mercator units are considered
+
+        Returns:
+            int: index of the nearest point. None if there is no point within the distance.
+        """
+        chunks = self.query(x - max_distance, y - max_distance, x + max_distance, y + max_distance)
+        if len(chunks) == 0:
+            return None
+        indices = (chunks[:, None] * self.chunk_size + self.offsets[None, :]).ravel()
+        distances = (self.x_padded[indices] - x) ** 2 + (self.y_padded[indices] - y) ** 2
+        distances[np.isnan(distances)] = np.inf
+        best = np.argmin(distances)
+        if distances[best] > max_distance ** 2:
+            return None
+        return int(indices[best])
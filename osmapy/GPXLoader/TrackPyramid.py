@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from osmapy.GPXLoader.TrackIndex import TrackIndex
+from osmapy.utils.config import config
+
+
+def simplify(x, y, tolerance):
+    """ Simplify a track by snapping it to a grid. A point is removed if it lies in the same grid cell as its
+    predecessor. The first and last point of every segment are kept. Segments are separated by NaN points.
+
+    Args:
+        x (np.ndarray): mercator x of the points
+        y (np.ndarray): mercator y of the points
+        tolerance (float): size of the grid cells in mercator units
+
+    Returns:
+        (np.ndarray, np.ndarray): mercator x and y of the remaining points
+    """
+    if len(x) < 3:
+        return x, y
+    cell_x = np.floor(x / tolerance)
+    cell_y = np.floor(y / tolerance)
+    keep = np.ones(len(x), dtype=bool)
+    # comparisons with NaN are always unequal, so the separators and the first points of the segments are kept
+    keep[1:] = (cell_x[1:] != cell_x[:-1]) | (cell_y[1:] != cell_y[:-1])
+    keep[:-1] |= np.isnan(x[1:])
+    keep[-1] = True
+    return x[keep], y[keep]
+
+
+class TrackPyramid:
+    """ Multi-resolution representation of a track. Each zoom level has a simplified copy of the track, where the
+    points are at least one pixel apart, so drawing it costs as much as the pixels it covers. Every level is derived
+    from the next finer one and has a TrackIndex to select the visible part.
+    """
+
+    def __init__(self, x, y, max_zoom):
+        """ Build all levels of the pyramid.
+
+        Args:
+            x (np.ndarray): mercator x of the points
+            y (np.ndarray): mercator y of the points
+            max_zoom (int): finest zoom level, the deepest zoom level of the view
+        """
+        self.size = len(x)
+        self.max_zoom = max_zoom
+        self.levels = dict()
+        for zoom in range(max_zoom, -1, -1):
+            pixel_size = 360 / (config.image_size * 2 ** zoom)  # width of a pixel in mercator units
+            x, y = simplify(x, y, pixel_size)
+            self.levels[zoom] = TrackIndex(x, y)
+
+    def get_level(self, zoom):
+        """ Get the simplified track for a zoom level.
+
+        Args:
+            zoom (int): zoom level of the view
+
+        Returns:
+            TrackIndex: index of the simplified track
+        """
+        return self.levels[int(np.clip(zoom, 0, self.max_zoom))]
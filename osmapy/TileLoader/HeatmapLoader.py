@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+import queue
+import threading
+from io import BytesIO
+
+import numpy as np
+from PySide2.QtCore import QObject, Signal
+
+from osmapy.GPXLoader.GPXLoader import parse_gpx
+from osmapy.TileLoader.TileLoader import TileLoader, shared_loaders
+from osmapy.utils.config import config
+
+
+class HeatmapLoader(QObject, TileLoader):
+    """ Layer which aggregates any number of GPX tracks into a density heatmap. For every zoom level the number of
+    tracks passing each pixel is counted. The counts are stored sparse per slippy tile and updated incrementally when a
+    track is added. The tiles are rendered by the workers of the TileLoader and cached on disk, so they are drawn like
+    slippy tiles and drawing does not depend on the number of tracks. One heatmap is shared by all views, see
+    get_shared_heatmap().
+    """
+
+    progress = Signal()  # a track was added
+    failed = Signal(str)  # a track could not be loaded
+
+    def __init__(self, viewer):
+        """ Create an empty heatmap.
+
+        Args:
+            viewer (Viewer): viewer object where the heatmap should be shown, None without a view
+        """
+        QObject.__init__(self)
+        self.name = "Heatmap"
+        self.urls = []
+        self.max_zoom = config.heatmap_max_zoom
+        self.show_error_tiles = False
+        # for every zoom level a dict with the tile numbers as keys and the sparse counts as values
+        self.counts = [dict() for _ in range(config.heatmap_max_zoom + 1)]
+        self.files = queue.Queue()
+
+        self.start(viewer)
+        threading.Thread(target=self.track_worker, daemon=True).start()
+
+    @classmethod
+    def get_shared_heatmap(cls, viewer):
+        """ Get the heatmap which is shared by all views. It is created by the first view and closed when the last
+        subscribed view is destroyed, so the tiles of the heatmap are only removed when it is created.
+
+        Args:
+            viewer (Viewer): view which subscribes to the heatmap
+
+        Returns:
+            HeatmapLoader: shared heatmap
+        """
+        if "Heatmap" not in shared_loaders:
+            shared_loaders["Heatmap"] = cls(None)
+        shared_loaders["Heatmap"].subscribe(viewer)
+        return shared_loaders["Heatmap"]
+
+    def load_cache_json(self):
+        """ The counts only exist in this session, so the tiles of former sessions are removed.
+
+        Returns:
+            (dict): empty cache database
+        """
+        self.path_cache.mkdir(parents=True, exist_ok=True)
+        for path in self.path_cache.glob("*.png"):
+            path.unlink()
+        return dict()
+
+    def add_file(self, path):
+        """ Add a GPX file to the heatmap. The file is loaded in the background.
+
+        Args:
+            path (pathlib.Path): path to the gpx file
+        """
+        self.files.put(path)
+
+    def track_worker(self):
+        """ Worker which loads the GPX files one after another and adds them to the counts.
+        """
+        while True:
+            path = self.files.get()
+            try:
+                chunks = list(parse_gpx(path))
+                if chunks:
+                    x = np.concatenate([chunk[0] for chunk in chunks])
+                    y = np.concatenate([chunk[1] for chunk in chunks])
+                    self.add_track(x, y)
+                    self.progress.emit()
+            except Exception as e:
+                self.failed.emit(f"{path}:\n{e}")
+
+    def add_track(self, x, y):
+        """ Add the pixels of a track to the counts of all zoom levels. Every track is counted once per pixel. Only the
+        tiles touched by the track are updated and rendered again.
+
+        Args:
+            x (np.ndarray): mercator x of the points
+            y (np.ndarray): mercator y of the points
+        """
+        valid = ~(np.isnan(x) | np.isnan(y))
+        x, y = x[valid], y[valid]
+        size = config.image_size
+        changed = []
+        for zoom, counts in enumerate(self.counts):
+            # global pixel numbers of the points at this zoom level
+            width = size * 2 ** zoom
+            pixel_x = np.clip(((x + 180.0) / 360.0 * width).astype(np.int64), 0, width - 1)
+            pixel_y = np.clip(((1.0 - y / 180.0) / 2.0 * width).astype(np.int64), 0, width - 1)
+            pixels = np.unique(pixel_x * width + pixel_y)
+            pixel_x, pixel_y = pixels // width, pixels % width
+
+            # group the pixels by their tile
+            tiles = (pixel_x // size) * 2 ** zoom + pixel_y // size
+            order = np.argsort(tiles, kind="stable")
+            tiles, pixel_x, pixel_y = tiles[order], pixel_x[order], pixel_y[order]
+            keys, starts = np.unique(tiles, return_index=True)
+            local = (pixel_y % size) * size + pixel_x % size  # row major index inside of the tile
+
+            for key, indices in zip(keys.tolist(), np.split(local, starts[1:])):
+                xtile, ytile = divmod(key, 2 ** zoom)
+                if (xtile, ytile) in counts:
+                    old_indices, old_counts = counts[(xtile, ytile)]
+                    indices, inverse = np.unique(np.concatenate((old_indices, indices)), return_inverse=True)
+                    weights = np.concatenate((old_counts, np.ones(len(inverse) - len(old_counts))))
+                    counts[(xtile, ytile)] = (indices, np.bincount(inverse, weights=weights).astype(np.uint32))
+                else:
+                    counts[(xtile, ytile)] = (indices, np.ones(len(indices), dtype=np.uint32))
+                changed.append(f"{xtile}_{ytile}_{zoom}")
+
+        with self.lock:
+            # the changed tiles are rendered again as soon as they are requested
+            for name in changed:
+                self.cache_json.pop(name, None)
+                self.images.pop(name, None)
+                self.decoding.discard(name)  # a decode of the old file which is still running is dropped
+                try:
+                    (self.path_cache / f"{name}.png").unlink()
+                except FileNotFoundError:
+                    pass
+            # the tiles above the maximum zoom level are cut out of the changed tiles
+            for name in [name for name in self.images if int(name.rsplit("_", 1)[1]) > self.max_zoom]:
+                self.images.pop(name)
+
+    def fetch(self, tile):
+        """ Render a tile of the heatmap. The color is scaled logarithmically with the number of tracks.
+
+        Args:
+            tile (Tile): tile object of the tile which should be rendered.
+
+        Returns:
+            bytes: PNG image of the tile
+        """
+        from PIL import Image
+
+        size = config.image_size
+        density = np.zeros(size * size, dtype=np.float32)
+        if tile.zoom < len(self.counts) and (tile.int_xtile, tile.int_ytile) in self.counts[tile.zoom]:
+            indices, counts = self.counts[tile.zoom][(tile.int_xtile, tile.int_ytile)]
+            density[indices] = np.log1p(counts) / np.log1p(config.heatmap_saturation)
+        density = np.clip(density, 0, 1).reshape(size, size)
+
+        rgba = np.zeros((size, size, 4), dtype=np.uint8)
+        rgba[..., 0] = 255
+        rgba[..., 1] = (255 * density).astype(np.uint8)  # from red to yellow
+        rgba[..., 3] = np.where(density > 0, 96 + 159 * density, 0).astype(np.uint8)
+        buffer = BytesIO()
+        Image.fromarray(rgba, "RGBA").save(buffer, "PNG")
+        return buffer.getvalue()
@@ -7,71 +7,201 @@ import queue
 import random
 import threading
 import time
-from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from string import Template
 
 import numpy as np
-import requests
-from PIL import Image
-from PySide2.QtGui import QPixmap
+from PySide2.QtCore import Qt, QRect, QRectF
+from PySide2.QtGui import QImage
 
 from osmapy.TileLoader.Tile import Tile
+from osmapy.TileLoader.TileMetrics import TileMetrics
+from osmapy.utils import lazy
 from osmapy.utils.config import config
 
+shared_loaders = dict()  # TileLoaders shared by the views with the name of their source as key
+
 
 class TileLoader:
     """ Class to load slippy tiles in a LIFO queue with workers. The tiles are cached and a cache database with a dict
     is maintained. The Tile Usage Policy of OSM is followed https://operations.osmfoundation.org/policies/tiles/.
+    Cache hits, downloads and failures are recorded in TileMetrics.
+
+    The tiles are decoded to QImages outside of the GUI thread, by the workers after a download and by a thread pool
+    for tiles from the disk. The decoded tiles are kept in a memory cache, so drawing only draws ready images. Tiles
+    above the maximum zoom level of the source are cut out of their ancestor and scaled up.
+
+    Several views can subscribe to one TileLoader, see get_shared(). They share the cache database, the memory cache
+    and the workers. A view which draws a tile that is not ready yet is updated as soon as this tile is ready.
     """
 
     def __init__(self, viewer, config_id):
         """ The constructor needs a viewer reference to update the map as soon as the slippy tile is loaded.
 
         Args:
-            viewer (Viewer): viewer object where the slippy tile should be shown
+            viewer (Viewer): viewer object where the slippy tile should be shown, None without a view
+            config_id (int): index of the source in the slippy tiles of the configuration
         """
         self.name = config.slippy_tiles[config_id].name
         self.urls = config.slippy_tiles[config_id].urls
+        self.max_zoom = config.slippy_tiles[config_id].get("max_zoom", 19)  # deepest zoom level of the tile server
+        self.show_error_tiles = True  # show an error image while a tile is not loaded
+
+        # not deferred to the first draw: it follows right after the view is shown and needs the cache database anyway
+        self.start(viewer)
+
+    @classmethod
+    def get_shared(cls, config_id, viewer):
+        """ Get the TileLoader of a source which is shared by all views. It is created by the first view and closed
+        when the last subscribed view is destroyed.
+
+        Args:
+            config_id (int): index of the source in the slippy tiles of the configuration
+            viewer (Viewer): view which subscribes to the TileLoader
+
+        Returns:
+            TileLoader: shared TileLoader of the source
+        """
+        name = config.slippy_tiles[config_id].name
+        if name not in shared_loaders:
+            shared_loaders[name] = cls(None, config_id)
+        shared_loaders[name].subscribe(viewer)
+        return shared_loaders[name]
 
-        self.path_cache = pathlib.Path(__file__).parent / pathlib.Path(f"../../cache/{self.name}")
-        self.viewer = viewer
+    def start(self, viewer, path_cache=None):
+        """ Load the cache database and start the workers.
+
+        Args:
+            viewer (Viewer): viewer object where the slippy tile should be shown, None without a view
+            path_cache (pathlib.Path): folder of the cached tiles, a folder in the cache of Osmapy by default
+        """
+        if path_cache is None:
+            path_cache = pathlib.Path(__file__).parent / pathlib.Path(f"../../cache/{self.name}")
+        self.path_cache = path_cache
+        self.viewers = set()  # subscribed views
+        self.requested = dict()  # views which wait for a tile with the name of the tile as key
 
         self.cache_json = self.load_cache_json()
+        self.metrics = TileMetrics(self.name)
 
         self.queue = queue.LifoQueue()
         self.lock = multiprocessing.Lock()
+        self.waiting = dict()  # events of the tiles somebody waits for, see wait_tile()
+        self.images = OrderedDict()  # memory cache of the decoded tiles, the least recently drawn tile first
+        self.decoding = set()  # names of the tiles which are decoded right now
+        self.missing = set()  # names of the tiles which were drawn before they were on the disk, counted once
+        self.decoder = ThreadPoolExecutor(max_workers=min(2, multiprocessing.cpu_count()))
+        self.error_image = None  # decoded on the first use
 
         for _ in range(min(2, multiprocessing.cpu_count())):    # only two download threads are allowed
             threading.Thread(target=self.worker, daemon=True).start()
 
+        if viewer is not None:
+            self.subscribe(viewer)
+
+    def subscribe(self, viewer):
+        """ Subscribe a view, so it is updated when the tiles it draws are ready. The view is unsubscribed when it is
+        destroyed.
+
+        Args:
+            viewer (Viewer): view which draws the tiles
+        """
+        with self.lock:
+            self.viewers.add(viewer)
+        viewer.destroyed.connect(lambda *_: self.unsubscribe(viewer))
+
+    def unsubscribe(self, viewer):
+        """ Unsubscribe a view. A shared TileLoader is closed when its last view is unsubscribed.
+
+        Args:
+            viewer (Viewer): view which does not draw the tiles anymore
+        """
+        with self.lock:
+            self.viewers.discard(viewer)
+            for viewers in self.requested.values():
+                viewers.discard(viewer)
+            unused = not self.viewers and shared_loaders.get(self.name) is self
+        if unused:
+            del shared_loaders[self.name]
+            self.close()
+
+    def request(self, name, viewer):
+        """ Remember that a view waits for a tile. The lock must be held.
+
+        Args:
+            name (str): internal name of the tile
+            viewer (Viewer): view which draws the tile, None without a view
+        """
+        if viewer is not None:
+            self.requested.setdefault(name, set()).add(viewer)
+
+    def notify(self, name):
+        """ Update the views which wait for a tile which is ready now. The lock must be held.
+
+        Args:
+            name (str): internal name of the tile
+        """
+        self.missing.discard(name)
+        for viewer in self.requested.pop(name, ()):
+            viewer.update()
+
     def worker(self):
-        """ Worker which downloads the tile, updates the cache database and saves the image. After this processed is
-        finished the viewer which requested the image is updated.
+        """ Worker which downloads the tile, updates the cache database, saves the image and decodes it into the memory
+        cache. After this processed is finished the viewer which requested the image is updated.
         """
         while True:
             tile = self.queue.get()
+            self.metrics.sample_queue(self.queue.qsize())
             # If an error occurse during the loading process the worker should't be blocked. The loading process is
             # tried again later, because the status of the tile in the cache database is still 'loading'.
             try:
-                osm_tile_url = random.choice(self.urls)  # randomly chose one of the servers in the list
-                request = Template(osm_tile_url)
-                request = request.substitute(zoom=tile.zoom, int_xtile=tile.int_xtile, int_ytile=tile.int_ytile)
-                # According to the OSM Tile Usage Policy an User-Agent is set
-                headers = {"User-Agent": config.user_agent}
-                response = requests.get(request, headers=headers)
-                image = Image.open(BytesIO(response.content))
+                content = self.fetch(tile)
+                image = QImage.fromData(content)
+                if image.isNull():
+                    raise ValueError(f"The tile {tile.name} is not a valid image")
 
                 with self.lock:     # to make the database thread safe
-                    image.save(self.path_cache / f"{tile.name}.png")    # TODO can images corrupt when window is closed?
+                    # TODO can images corrupt when window is closed?
+                    (self.path_cache / f"{tile.name}.png").write_bytes(content)
+                    if self.viewers:  # without view the tiles are only served from the disk
+                        self.remember_image(tile.name, image)
                     expire_time = 60 * 60 * 24 * 7  # 7 days
                     self.cache_json[tile.name]["time"] = time.time() + expire_time
                     self.cache_json[tile.name]["state"] = "loaded"
-                    self.viewer.update()
-
-                self.queue.task_done()
+                    if tile.name in self.waiting:
+                        self.waiting.pop(tile.name).set()
+                    self.notify(tile.name)
             except Exception as e:
                 # an error needn't been handled any further because the loading will be retried automatically
-                print("Error:", e)
+                self.metrics.failure(e)
+                with self.lock:
+                    self.requested.pop(tile.name, None)  # the views request the tile again with the retry
+                    self.missing.discard(tile.name)
+            finally:
+                self.queue.task_done()  # a failed tile must not block waiting for the queue
+
+    def fetch(self, tile):
+        """ Download a tile from one of the tile servers.
+
+        Args:
+            tile (Tile): tile object of the tile which should be loaded.
+
+        Returns:
+            bytes: encoded image of the tile as it was sent by the server
+        """
+        requests = lazy.requests()
+
+        osm_tile_url = random.choice(self.urls)  # randomly chose one of the servers in the list
+        request = Template(osm_tile_url)
+        request = request.substitute(zoom=tile.zoom, int_xtile=tile.int_xtile, int_ytile=tile.int_ytile)
+        # According to the OSM Tile Usage Policy an User-Agent is set
+        headers = {"User-Agent": config.user_agent}
+        start = time.perf_counter()
+        response = requests.get(request, headers=headers)
+        response.raise_for_status()
+        self.metrics.download(time.perf_counter() - start, len(response.content))
+        return response.content
 
     def get_tile(self, tile):
         """ Request a tile to be loaded.
@@ -93,22 +223,155 @@ class TileLoader:
                 self.cache_json[tile.name] = {"state": "loading",
                                               "time": time.time()}
                 self.queue.put(tile)
+                self.metrics.count("queued")
             if tile.name in self.cache_json:
                 # if the tile is already in the cache database and the loading is not yet finished but a waiting time
                 # is exceeded. The loading will be tried again.
                 if self.cache_json[tile.name]["state"] == "loading" and \
                         self.cache_json[tile.name]["time"] + config.retry_time_tile < time.time():
-                    self.cache_json["time"] = time.time()
+                    self.cache_json[tile.name]["time"] = time.time()
                     self.queue.put(tile)
+                    self.metrics.count("retry")
                 # reload after reaching expiring date
                 if self.cache_json[tile.name]["state"] == "loaded" and \
                         self.cache_json[tile.name]["time"] < time.time():
                     self.cache_json[tile.name] = {"state": "loading",
                                                   "time": time.time()}
                     self.queue.put(tile)
+                    self.metrics.count("expired")
+            self.metrics.sample_queue(self.queue.qsize())
 
         return str(self.path_cache / f"{tile.name}.png")
 
+    def wait_tile(self, tile, timeout):
+        """ Request a tile and wait until it is loaded. Concurrent requests of the same tile wait for the same download.
+        A tile which is cached is returned at once, even if it expired and is loaded again in the background.
+
+        Args:
+            tile (Tile): tile object of the tile which should be loaded.
+            timeout (float): seconds to wait for the tile
+
+        Returns:
+            pathlib.Path: path of the loaded tile or None if the tile cannot exist or was not loaded in time
+        """
+        deadline = time.time() + timeout
+        while True:
+            path_image = self.get_tile(tile)  # also retries the loading according to the cache database
+            if path_image is None:
+                return None
+            path_image = pathlib.Path(path_image)
+            with self.lock:
+                if path_image.is_file():
+                    return path_image
+                event = self.waiting.setdefault(tile.name, threading.Event())
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            event.wait(min(remaining, config.retry_time_tile))
+
+    def remember_image(self, name, image):
+        """ Add a decoded tile to the memory cache and remove the least recently drawn tiles if it is full. The lock
+        must be held.
+
+        Args:
+            name (str): internal name of the tile
+            image (QImage): decoded tile
+        """
+        self.images[name] = image
+        self.images.move_to_end(name)
+        while len(self.images) > config.tile_memory_cache_size:
+            self.images.popitem(last=False)
+
+    def decode(self, name, path_image):
+        """ Decode a tile from the disk into the memory cache. This runs in the thread pool of the decoder.
+
+        Args:
+            name (str): internal name of the tile
+            path_image (pathlib.Path): path of the tile
+        """
+        image = QImage(str(path_image))
+        with self.lock:
+            current = name in self.decoding  # the tile may have been replaced while it was decoded
+            self.decoding.discard(name)
+            if current and not image.isNull():
+                self.remember_image(name, image)
+            self.notify(name)
+
+    def get_image(self, tile, path_image, viewer=None):
+        """ Get the decoded image of a tile from the memory cache. A tile which is only on the disk is decoded in the
+        background and is available in a later frame.
+
+        Args:
+            tile (Tile): tile object of the tile which should be drawn.
+            path_image (str): path of the tile on the disk
+            viewer (Viewer): view which draws the tile, it is updated when the tile is ready
+
+        Returns:
+            QImage: decoded tile or None if it is not decoded yet
+        """
+        with self.lock:
+            image = self.images.get(tile.name)
+            if image is not None:
+                self.images.move_to_end(tile.name)
+                self.metrics.count("memory_hit")
+                return image
+            self.request(tile.name, viewer)
+            if tile.name in self.decoding or tile.name in self.missing:
+                return None  # the miss was counted when the tile was requested the first time
+            self.metrics.count("memory_miss")
+            path_image = pathlib.Path(path_image)
+            if path_image.is_file():
+                self.metrics.count("disk_hit")
+                self.decoding.add(tile.name)
+                self.decoder.submit(self.decode, tile.name, path_image)
+            else:
+                self.metrics.count("disk_miss")
+                self.missing.add(tile.name)
+        return None
+
+    def get_overzoom_image(self, tile, viewer=None):
+        """ Get the image of a tile above the maximum zoom level. It is cut out of the ancestor tile at the maximum zoom
+        level and scaled up. Until the ancestor is decoded a coarser ancestor from the memory cache is used. Only images
+        from the ancestor at the maximum zoom level are kept in the memory cache.
+
+        Args:
+            tile (Tile): tile object of the tile which should be drawn.
+            viewer (Viewer): view which draws the tile, it is updated when the ancestor is ready
+
+        Returns:
+            QImage: image of the tile or None if no ancestor is available yet
+        """
+        with self.lock:
+            image = self.images.get(tile.name)
+            if image is not None:
+                self.images.move_to_end(tile.name)
+                self.metrics.count("memory_hit")
+                return image
+
+        for zoom in range(self.max_zoom, -1, -1):
+            shift = tile.zoom - zoom
+            xtile, ytile = tile.int_xtile >> shift, tile.int_ytile >> shift
+            ancestor = Tile.from_num(xtile + 0.5, ytile + 0.5, zoom)
+            if zoom == self.max_zoom:
+                ancestor_image = self.get_image(ancestor, self.get_tile(ancestor), viewer)
+            else:
+                with self.lock:
+                    ancestor_image = self.images.get(ancestor.name)
+            if ancestor_image is None:
+                continue
+
+            size = ancestor_image.width() / 2 ** shift
+            part = QRect(int((tile.int_xtile - (xtile << shift)) * size),
+                         int((tile.int_ytile - (ytile << shift)) * size),
+                         max(1, int(size)), max(1, int(size)))
+            image = ancestor_image.copy(part).scaled(config.image_size, config.image_size, Qt.IgnoreAspectRatio,
+                                                     Qt.SmoothTransformation)
+            if zoom == self.max_zoom:
+                with self.lock:
+                    self.remember_image(tile.name, image)
+            return image
+        return None
+
     def load_cache_json(self):
         """ Load the cache database which is a json file. If the database does not exists create it with its folder.
 
@@ -139,6 +402,8 @@ class TileLoader:
         # TODO is there a better/safer way?
         with self.lock:
             self.save_cache_json()
+        self.decoder.shutdown(wait=False)
+        self.metrics.dump(self.path_cache / "metrics.json")
 
     def draw(self, viewer, qpainter, alpha):
         """ Function to draw on a View.
@@ -160,16 +425,18 @@ class TileLoader:
                 tile = Tile.from_num(main_tile.xtile + a, main_tile.ytile + b, main_tile.zoom)
                 if not tile.check_existance():
                     continue
-                path_image = self.get_tile(tile)
-
-                # try:
-                if pathlib.Path(path_image).is_file():
-                    pic = QPixmap(str(path_image))
+                if tile.zoom > self.max_zoom:
+                    image = self.get_overzoom_image(tile, viewer)
                 else:
-                    pic = QPixmap(viewer.asset_error_image)
+                    image = self.get_image(tile, self.get_tile(tile), viewer)
+                if image is None:
+                    if not self.show_error_tiles or tile.name in self.decoding:
+                        continue  # a tile from the disk appears as soon as it is decoded
+                    if self.error_image is None:
+                        self.error_image = QImage(viewer.asset_error_image)
+                    image = self.error_image
 
-                pic = pic.scaled(config.image_size, config.image_size)
-                qpainter.drawTiledPixmap(
+                qpainter.drawImage(QRectF(
                     -offset_x + a * config.image_size + viewer.frameGeometry().width() * 0.5 - config.image_size * 0.5,
                     offset_y + b * config.image_size + viewer.frameGeometry().height() * 0.5 - config.image_size * 0.5,
-                    config.image_size, config.image_size, pic)
+                    config.image_size, config.image_size), image)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import json
+import threading
+import time
+from collections import Counter, deque
+
+
+class Histogram:
+    """ Histogram with fixed bucket boundaries. A value is counted in the first bucket whose upper bound is not smaller
+    than the value, larger values are counted in the last bucket.
+    """
+
+    def __init__(self, bounds):
+        """
+        Args:
+            bounds ([float]): sorted upper bounds of the buckets
+        """
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, value):
+        """ Count a value.
+
+        Args:
+            value (float): observed value
+        """
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def to_dict(self):
+        """ Histogram as a dict which can be serialized to JSON.
+
+        Returns:
+            dict: number of values, mean, maximum and the counts of the buckets with their upper bounds as keys
+        """
+        buckets = {f"<={bound:g}": count for bound, count in zip(self.bounds, self.counts)}
+        buckets[f">{self.bounds[-1]:g}"] = self.counts[-1]
+        return {"count": self.count,
+                "mean": self.total / self.count if self.count else 0.0,
+                "max": self.maximum,
+                "buckets": buckets}
+
+
+class TileMetrics:
+    """ Counters and histograms of a TileLoader. They show how well the caches work and when a tile server becomes
+    slow or fails. All methods are thread safe, so the workers and the GUI thread can record and read the metrics at
+    the same time.
+    """
+
+    def __init__(self, name, queue_history=1000):
+        """
+        Args:
+            name (str): name of the layer
+            queue_history (int): number of samples of the queue depth which are kept
+        """
+        self.name = name
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.counters = Counter()  # e.g. disk_hit, disk_miss, queued, retry, expired, download
+        self.failures = Counter()  # failed loads by HTTP status or error type
+        self.recent_errors = deque(maxlen=20)
+        self.latency = Histogram([10, 25, 50, 100, 250, 500, 1000, 2500, 5000])  # milliseconds
+        self.size = Histogram([1024, 4096, 16384, 32768, 65536, 131072])  # bytes
+        self.bytes = 0
+        self.queue_depth = deque(maxlen=queue_history)  # (seconds since start, depth)
+        self.max_queue_depth = 0
+
+    def count(self, counter, number=1):
+        """ Increase a counter.
+
+        Args:
+            counter (str): name of the counter
+            number (int): increment
+        """
+        with self.lock:
+            self.counters[counter] += number
+
+    def download(self, seconds, size):
+        """ Record a finished download.
+
+        Args:
+            seconds (float): duration of the download
+            size (int): size of the response in bytes
+        """
+        with self.lock:
+            self.counters["download"] += 1
+            self.latency.observe(seconds * 1000)
+            self.size.observe(size)
+            self.bytes += size
+
+    def failure(self, error):
+        """ Record a failed load. HTTP errors are counted by their status code, other errors by their type.
+
+        Args:
+            error (Exception): error which occurred while loading the tile
+        """
+        status = getattr(getattr(error, "response", None), "status_code", None)
+        with self.lock:
+            self.failures[str(status) if status is not None else type(error).__name__] += 1
+            self.recent_errors.append(f"{time.strftime('%H:%M:%S')} {error}")
+
+    def sample_queue(self, depth):
+        """ Record the number of queued tiles. Only changes of the number are kept.
+
+        Args:
+            depth (int): number of tiles in the queue
+        """
+        with self.lock:
+            if not self.queue_depth or self.queue_depth[-1][1] != depth:
+                self.queue_depth.append((round(time.time() - self.start_time, 3), depth))
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def snapshot(self):
+        """ Current state of the metrics.
+
+        Returns:
+            dict: all counters and histograms, can be serialized to JSON
+        """
+        with self.lock:
+            hits, misses = self.counters["disk_hit"], self.counters["disk_miss"]
+            return {"name": self.name,
+                    "uptime": round(time.time() - self.start_time, 3),
+                    "counters": dict(self.counters),
+                    "disk_hit_rate": hits / (hits + misses) if hits + misses else None,
+                    "failures": dict(self.failures),
+                    "recent_errors": list(self.recent_errors),
+                    "latency_ms": self.latency.to_dict(),
+                    "size_bytes": self.size.to_dict(),
+                    "bytes": self.bytes,
+                    "queue_depth": list(self.queue_depth),
+                    "max_queue_depth": self.max_queue_depth}
+
+    def dump(self, path):
+        """ Write the current state of the metrics to a JSON file.
+
+        Args:
+            path (pathlib.Path): path of the file
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as json_file:
+            json.dump(self.snapshot(), json_file, indent=2)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+""" Headless proxy which serves the tile caches of the configured slippy tile sources as XYZ endpoints in the local
+network. Missing tiles are loaded from the tile servers by a TileLoader with its usual policy, so several Osmapy
+instances share one cache and the tile servers see every tile only once. Other instances use URLs like
+
+    http://HOST:PORT/${name}/${zoom}/${int_xtile}/${int_ytile}.png
+
+in their configuration, where name is the name of the source in the configuration of the proxy.
+"""
+
+import re
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import unquote
+
+from osmapy.TileLoader.Tile import Tile
+from osmapy.TileLoader.TileLoader import TileLoader
+from osmapy.utils.config import config
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    """ Answer the requests of a single tile. The path has the form /name/zoom/x/y.png.
+    """
+
+    path_pattern = re.compile(r"^/(?P<name>[^/]+)/(?P<zoom>\d+)/(?P<x>\d+)/(?P<y>\d+)\.png$")
+
+    def do_GET(self):
+        match = self.path_pattern.match(self.path.split("?")[0])
+        if not match:
+            self.send_error(404, "Expected /name/zoom/x/y.png")
+            return
+        tile_loader = self.server.tile_loaders.get(unquote(match["name"]))
+        if tile_loader is None:
+            self.send_error(404, f"Unknown tile source {unquote(match['name'])}")
+            return
+
+        zoom, xtile, ytile = int(match["zoom"]), int(match["x"]), int(match["y"])
+        if xtile >= 2 ** zoom or ytile >= 2 ** zoom or zoom > tile_loader.max_zoom:
+            self.send_error(404, "Tile does not exist")
+            return
+        # the center of the tile avoids rounding errors at its border
+        path_image = tile_loader.wait_tile(Tile.from_num(xtile + 0.5, ytile + 0.5, zoom), self.server.tile_timeout)
+        if path_image is None:
+            self.send_error(504, "The tile could not be loaded from the tile server")
+            return
+
+        with tile_loader.lock:  # the file is not written while it is read
+            content = path_image.read_bytes()
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Cache-Control", "max-age=86400")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super(TileRequestHandler, self).log_message(format, *args)
+
+
+class TileServer(ThreadingMixIn, HTTPServer):
+    """ HTTP server with one TileLoader without view for every configured slippy tile source.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, timeout=30, verbose=False):
+        """
+        Args:
+            address ((str, int)): host and port to listen on
+            timeout (float): seconds a request waits for a tile from the tile server
+            verbose (bool): log every request to stderr
+        """
+        super(TileServer, self).__init__(address, TileRequestHandler)
+        self.tile_timeout = timeout
+        self.verbose = verbose
+        self.tile_loaders = {source.name: TileLoader(None, config_id)
+                             for config_id, source in enumerate(config.slippy_tiles)}
+
+    def close(self):
+        """ Stop the server and save the cache databases.
+        """
+        self.server_close()
+        for tile_loader in self.tile_loaders.values():
+            tile_loader.close()
+
+
+def serve(address, timeout=30, verbose=False):
+    """ Serve the tile caches until the process is interrupted.
+
+    Args:
+        address ((str, int)): host and port to listen on
+        timeout (float): seconds a request waits for a tile from the tile server
+        verbose (bool): log every request to stderr
+    """
+    server = TileServer(address, timeout, verbose)
+    host, port = server.server_address[:2]
+    for name in server.tile_loaders:
+        print(f"Serving {name} at http://{host}:{port}/{name}/{{z}}/{{x}}/{{y}}.png")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
@@ -77,8 +77,7 @@ class ElementViewer(QWidget):
     def delete_node(self):
         """ Delete the currently selected node.
         """
-        del self.parent.elements_loader.elements[self.id]
-        self.parent.elements_loader.selected_node = None
+        self.parent.elements_loader.delete_node(self.id)
         self.parent.viewer.update()
         self.clear()
 
@@ -89,9 +88,8 @@ class ElementViewer(QWidget):
             field (str): property which should be changed
             value (str): new value
         """
-        # TODO typechecking
-        self.parent.elements_loader.elements[self.id].data[field] = value
-        self.parent.viewer.update()
+        if self.parent.elements_loader.set_coordinate(self.id, field, value):
+            self.parent.viewer.update()
 
     def modify_tag(self, key, value):
         """ Callback to modify a tag
@@ -100,7 +98,7 @@ class ElementViewer(QWidget):
             key (str): tag key
             value (str): tag value
         """
-        self.parent.elements_loader.elements[self.id].data["tags"][key] = value
+        self.parent.elements_loader.set_tag(self.id, key, value)
         self.parent.viewer.update()
 
     def remove_tag(self, key):
@@ -109,7 +107,7 @@ class ElementViewer(QWidget):
         Args:
             key (str): key of the tag which should be removed
         """
-        del self.parent.elements_loader.elements[self.id].data["tags"][key]
+        self.parent.elements_loader.remove_tag(self.id, key)
         self.set_node(self.parent.elements_loader.elements[self.id])
 
     def new_tag(self):
@@ -119,5 +117,5 @@ class ElementViewer(QWidget):
         if ok and key:
             value, ok = QInputDialog().getText(self, "New Tag", "Value", QLineEdit.Normal)
             if ok and value:
-                self.parent.elements_loader.elements[self.id].data["tags"][key] = value
+                self.parent.elements_loader.set_tag(self.id, key, value)
                 self.set_node(self.parent.elements_loader.elements[self.id])
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import logging.handlers
+import pathlib
+import time
+from collections import deque
+
+from PySide2.QtCore import QRect
+from PySide2.QtGui import QBrush, QColor, QFont, QPen
+
+path_log = pathlib.Path(__file__).parent / pathlib.Path("../../cache/frames.log")
+logger = logging.getLogger("osmapy.frames")  # shared by the profilers of all views
+
+
+def get_logger():
+    """ Get the logger of the frame metrics. The log file is opened with the first call, so the views share one
+    handler.
+
+    Returns:
+        Logger: logger which writes to the rolling log file
+    """
+    if not logger.handlers:
+        path_log.parent.mkdir(parents=True, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(path_log, maxBytes=1024 * 1024, backupCount=3)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.addHandler(handler)
+    return logger
+
+
+class FrameProfiler:
+    """ Measure the duration of every frame of the viewer and of the drawing of every layer. The numbers are kept for
+    the last frames and can be shown as an overlay in the left top corner of the map, read with metrics() and written to
+    a rolling log file once per second.
+    """
+
+    def __init__(self, name="main", history=120, log=False):
+        """
+        Args:
+            name (str): name of the view which is written in front of every logged line
+            history (int): number of frames which are kept to calculate the averages
+            log (bool): write the metrics to a rolling log file
+        """
+        self.name = name
+        self.margin = 4
+        self.visible = False  # show the overlay
+        self.frames = deque(maxlen=history)  # (start time, duration) of the last frames
+        self.layers = dict()  # durations of the last frames for every layer name
+        self.frame_start = None
+        self.last_log = time.perf_counter()
+
+        self.font = QFont("Monospace")
+        self.font.setStyleHint(QFont.TypeWriter)
+        self.font.setPointSize(8)
+
+        self.logger = get_logger() if log else None
+
+    def begin_frame(self):
+        """ Mark the beginning of a frame.
+        """
+        self.frame_start = time.perf_counter()
+
+    def measure(self, name, draw, *args):
+        """ Call the draw function of a layer and measure its duration.
+
+        Args:
+            name (str): name of the layer
+            draw (callable): draw function of the layer
+            *args: arguments of the draw function
+        """
+        start = time.perf_counter()
+        draw(*args)
+        if name not in self.layers:
+            self.layers[name] = deque(maxlen=self.frames.maxlen)
+        self.layers[name].append(time.perf_counter() - start)
+
+    def end_frame(self):
+        """ Mark the end of a frame. The metrics are logged if the last entry is older than one second.
+        """
+        now = time.perf_counter()
+        self.frames.append((self.frame_start, now - self.frame_start))
+        if self.logger is not None and now - self.last_log >= 1:
+            self.last_log = now
+            for line in self.format_metrics(self.metrics()).splitlines():
+                self.logger.info("%s %s", self.name, line)
+
+    def fps(self):
+        """ Number of frames per second of the last second.
+
+        Returns:
+            float: frames per second
+        """
+        if not self.frames:
+            return 0.0
+        now = time.perf_counter()
+        return float(sum(1 for start, _ in self.frames if start > now - 1))
+
+    def metrics(self):
+        """ Metrics of the last frames. The durations are in milliseconds.
+
+        Returns:
+            dict: frames per second, duration of the last frame and the mean and maximum duration of the frames and of
+            every layer which was drawn in the last frames
+        """
+        durations = [duration for _, duration in self.frames]
+        return {"fps": self.fps(),
+                "frames": len(durations),
+                "frame": self.summarize(durations),
+                "layers": {name: self.summarize(layer) for name, layer in self.layers.items()}}
+
+    @staticmethod
+    def summarize(durations):
+        """ Summarize durations in milliseconds.
+
+        Args:
+            durations ([float]): durations in seconds
+
+        Returns:
+            dict: last, mean and maximum duration in milliseconds
+        """
+        if not durations:
+            return {"last_ms": 0.0, "mean_ms": 0.0, "max_ms": 0.0}
+        return {"last_ms": round(durations[-1] * 1000, 3),
+                "mean_ms": round(sum(durations) / len(durations) * 1000, 3),
+                "max_ms": round(max(durations) * 1000, 3)}
+
+    @staticmethod
+    def format_metrics(metrics):
+        """ Text representation of the metrics with one line per layer.
+
+        Args:
+            metrics (dict): result of metrics()
+
+        Returns:
+            str: lines of the metrics
+        """
+        lines = [f"{metrics['fps']:.0f} fps, frame {metrics['frame']['last_ms']:.1f} ms "
+                 f"(mean {metrics['frame']['mean_ms']:.1f} ms, max {metrics['frame']['max_ms']:.1f} ms)"]
+        for name, layer in metrics["layers"].items():
+            lines.append(f"{name}: {layer['last_ms']:.1f} ms (mean {layer['mean_ms']:.1f} ms)")
+        return "\n".join(lines)
+
+    def toggle(self):
+        """ Show or hide the overlay.
+        """
+        self.visible = not self.visible
+
+    def draw(self, viewer, qpainter):
+        """ Draw the metrics of the last frames in the left top corner of the view.
+
+        Args:
+            viewer (Viewer): object which must is drawn on and which must be updated
+            qpainter (QPainter): object which is used to draw
+        """
+        if not self.visible:
+            return
+        qpainter.setOpacity(1)
+        qpainter.setFont(self.font)
+        text = self.format_metrics(self.metrics())
+        rect = qpainter.boundingRect(QRect(0, 0, viewer.frameGeometry().width(), viewer.frameGeometry().height()),
+                                     0, text)
+        rect.adjust(0, 0, 2 * self.margin, 2 * self.margin)
+        qpainter.fillRect(rect, QBrush(QColor(255, 255, 255, 200)))
+        qpainter.setPen(QPen(QColor(0, 0, 0)))
+        qpainter.drawText(rect.adjusted(self.margin, self.margin, 0, 0), 0, text)
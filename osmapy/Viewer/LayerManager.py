@@ -72,8 +72,16 @@ class LayerManager(QWidget):
         Returns:
             [Objects]: objects which implement a draw function
         """
+        return [(layer, alpha) for _, layer, alpha in self.get_named_layers()]
+
+    def get_named_layers(self):
+        """ Get list of the enabled layers with their names in the order of the LayerManager in the UI.
+
+        Returns:
+            [(str, Object, float)]: name, object which implements a draw function and opacity
+        """
         names = [self.layer_widget.item(i).data(0) for i in range(self.layer_widget.count())]
-        result = [(self.layers[name]["layer"], self.layers[name]["alpha"]) for name in names if
+        result = [(name, self.layers[name]["layer"], self.layers[name]["alpha"]) for name in names if
                   self.layers[name]["state"]]
         return result
 
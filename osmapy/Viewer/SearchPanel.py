@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+from PySide2.QtCore import Qt
+from PySide2.QtWidgets import QWidget, QGridLayout, QLineEdit, QListWidget, QListWidgetItem, QLabel
+
+
+class SearchPanel(QWidget):
+    """ Widget to search the loaded nodes by their tags. The found nodes are highlighted on the map and listed. A click
+    on a found node selects it and moves the map to it.
+    """
+
+    def __init__(self, parent):
+        super(SearchPanel, self).__init__()
+        self.parent = parent
+        self.max_results = 500  # number of found nodes which are listed
+
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("amenity=bench & !name")
+        self.search_edit.setToolTip("key, !key, key=value, key=prefix* or prefix*, combined with &")
+        self.result_label = QLabel("Search nodes by their tags")
+        self.result_list = QListWidget()
+
+        layout = QGridLayout()
+        layout.addWidget(self.search_edit, 0, 0, 1, 1)
+        layout.addWidget(self.result_label, 1, 0, 1, 1)
+        layout.addWidget(self.result_list, 2, 0, 1, 1)
+        self.setLayout(layout)
+
+        self.search_edit.textChanged.connect(self.search)
+        self.result_list.itemClicked.connect(self.select)
+
+    def search(self, query):
+        """ Callback when the query changed. The found nodes are highlighted and listed.
+
+        Args:
+            query (str): query of the TagIndex
+        """
+        elements_loader = self.parent.elements_loader
+        ids = elements_loader.search(query)
+
+        self.result_list.clear()
+        for node_id in sorted(ids)[:self.max_results]:
+            tags = elements_loader.elements[node_id].data["tags"]
+            item = QListWidgetItem(f"{node_id} {tags.get('name', '')}")
+            item.setData(Qt.UserRole, node_id)
+            self.result_list.addItem(item)
+        if query.strip():
+            more = f", the first {self.max_results} are listed" if len(ids) > self.max_results else ""
+            self.result_label.setText(f"{len(ids)} nodes found{more}")
+        else:
+            self.result_label.setText("Search nodes by their tags")
+        self.parent.viewer.update()
+
+    def select(self, item):
+        """ Callback when a found node is clicked. The node is selected and the map is moved to it.
+
+        Args:
+            item (QListWidgetItem): clicked item
+        """
+        self.parent.viewer.select_node(item.data(Qt.UserRole))
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from PySide2 import QtCore
+from PySide2.QtGui import QColor, QPen
+
+
+class ValidationLayer:
+    """ Layer which marks the nodes with problems found by the Validator of the ElementsLoader.
+    """
+
+    def __init__(self, elements_loader):
+        """
+        Args:
+            elements_loader (ElementsLoader): loader with the validated nodes
+        """
+        self.elements_loader = elements_loader
+        self.pen = QPen(QColor(QtCore.Qt.magenta), 2)
+        self.invalid = (-1, set())  # version of the validator and ids of the nodes with problems
+
+    def get_invalid(self):
+        """ Get the ids of the nodes with problems. The result is kept until the validator changes.
+
+        Returns:
+            set: ids of the nodes
+        """
+        validator = self.elements_loader.validator
+        if self.invalid[0] != validator.version:
+            self.invalid = (validator.version, validator.invalid())
+        return self.invalid[1]
+
+    def draw(self, viewer, qpainter, alpha):
+        """ Function to draw on a View.
+
+        Args:
+            viewer (Viewer): object which must is drawn on and which must be updated
+            qpainter (QPainter): object which is used to draw
+            alpha (float): opacity to draw
+        """
+        if self.elements_loader.show_clusters(viewer):
+            return  # single nodes are not visible
+        qpainter.setOpacity(alpha)
+        qpainter.setBrush(QColor(0, 0, 0, 0))
+        qpainter.setPen(self.pen)
+        width, height = viewer.frameGeometry().width(), viewer.frameGeometry().height()
+        size = 16
+        elements = self.elements_loader.elements
+        for node_id in self.get_invalid():
+            if node_id not in elements:
+                continue
+            xscreen, yscreen = viewer.xy2screen(elements[node_id].x, elements[node_id].y)
+            if -size <= xscreen <= width + size and -size <= yscreen <= height + size:
+                qpainter.drawRect(QtCore.QRectF(xscreen - size / 2, yscreen - size / 2, size, size))
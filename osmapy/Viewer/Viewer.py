@@ -6,11 +6,14 @@ import webbrowser
 import numpy as np
 from PySide2 import QtCore
 from PySide2.QtGui import QPainter, QColor, QPen
-from PySide2.QtWidgets import (QDialog, QApplication)
+from PySide2.QtWidgets import (QDialog, QApplication, QMessageBox, QToolTip)
 
 from osmapy.GPXLoader.GPXLoader import GPXLoader
 from osmapy.TileLoader import TileLoader, Tile
+from osmapy.TileLoader.HeatmapLoader import HeatmapLoader
+from osmapy.Viewer.FrameProfiler import FrameProfiler
 from osmapy.Viewer.OSMCopyright import OSMCopyright
+from osmapy.Viewer.ValidationLayer import ValidationLayer
 from osmapy.utils import calc
 from osmapy.utils.config import config
 
@@ -19,12 +22,21 @@ class Viewer(QDialog):
     """ Viewer widget where the map is shown with the slippy tiles in the background and OSM objects.
     """
 
-    def __init__(self, parent=None):
+    painted = QtCore.Signal()  # a frame was painted
+
+    def __init__(self, parent=None, layer_manager=None, name="main"):
+        """
+        Args:
+            parent (QMainWindow): main window with the loaded elements and the ElementViewer
+            layer_manager (LayerManager): layers of this view, the LayerManager of the main window by default
+            name (str): name of the view in the frame log
+        """
         super(Viewer, self).__init__()
 
+        # the tile loaders are shared with the other views
         self.tile_loaders = []
         for config_id in range(len(config.slippy_tiles)):
-            self.tile_loaders.append(TileLoader.TileLoader(self, config_id))
+            self.tile_loaders.append(TileLoader.TileLoader.get_shared(config_id, self))
         self.parent = parent
         self.element_viewer = self.parent.element_viewer
 
@@ -42,20 +54,21 @@ class Viewer(QDialog):
 
         self.elements_loader = self.parent.elements_loader
 
-        for tile_loader in self.tile_loaders:
-            self.destroyed.connect(tile_loader.close)
-
         path_base = pathlib.Path(__file__).parent
         self.asset_error_image = str(path_base / pathlib.Path("../assets/error.png"))
 
         self.osm_copyright = OSMCopyright()
+        self.frame_profiler = FrameProfiler(name, log=config.get("frame_log", False))
 
         self.setAcceptDrops(True)  # allow file dropping
+        self.setMouseTracking(True)  # mouse move events without a pressed button to hover over GPX tracks
 
-        self.layers = self.parent.layer_manager
+        self.layers = layer_manager if layer_manager is not None else self.parent.layer_manager
         for config_id, tile_loader in enumerate(self.tile_loaders):
             self.layers.add_layer(tile_loader, config.slippy_tiles[config_id].name, config.slippy_tiles[config_id].enabled)
         self.layers.add_layer(self.elements_loader, "OSM Nodes")
+        self.layers.add_layer(ValidationLayer(self.elements_loader), "Validation")
+        self.heatmap = None  # created when the first GPX files are added to the heatmap
 
         self.mode = "normal"  # mode for clicking events
 
@@ -137,11 +150,12 @@ class Viewer(QDialog):
         Args:
             event (Event): not yet used
         """
+        self.frame_profiler.begin_frame()
         qpainter = QPainter(self)
         qpainter.setRenderHint(QPainter.Antialiasing)
 
-        for layer, alpha in self.layers.get_layers():
-            layer.draw(self, qpainter, alpha)
+        for name, layer, alpha in self.layers.get_named_layers():
+            self.frame_profiler.measure(name, layer.draw, self, qpainter, alpha)
 
         qpainter.setBrush(QColor(0, 0, 0, 0))
         qpainter.setPen(QPen(QColor(QtCore.Qt.black), 1))
@@ -151,6 +165,13 @@ class Viewer(QDialog):
 
         # draw OSM information
         self.osm_copyright.draw(self, qpainter)
+        self.frame_profiler.end_frame()
+
+        # draw the timing of the frames, it is not part of the measured frame
+        self.frame_profiler.draw(self, qpainter)
+        qpainter.end()
+
+        self.painted.emit()
 
     def wheelEvent(self, event):
         """ Callback when the mouse wheel is used. Here the zooming is realized.
@@ -160,7 +181,7 @@ class Viewer(QDialog):
         """
         if abs(event.delta()) != 0:
             delta = event.delta() // abs(event.delta())
-            if delta == 1 and self.zoom < 19:
+            if delta == 1 and self.zoom < config.max_zoom:
                 self.set_zoom(self.zoom + 1)
 
                 self.update()
@@ -190,6 +211,23 @@ class Viewer(QDialog):
 
                 self.set_xy(set_x, set_y)
                 self.update()
+        elif event.buttons() == QtCore.Qt.NoButton:
+            self.show_track_point(event)
+
+    def show_track_point(self, event):
+        """ Show the time of the GPX track point under the mouse as a tooltip.
+
+        Args:
+            event (Event): contains the position of the mouse
+        """
+        for layer, _ in self.layers.get_layers():
+            if isinstance(layer, GPXLoader):
+                point = layer.nearest_point(self, event.x(), event.y())
+                if point is not None:
+                    lat, lon = calc.xy2deg(point[0], point[1])
+                    QToolTip.showText(event.globalPos(), f"Time: {point[2]}\nLat: {lat:.7f} Lon: {lon:.7f}", self)
+                    return
+        QToolTip.hideText()
 
     def mouseReleaseEvent(self, event):
         """ Callback when the mouse is released. This is needed to realize the dragging.
@@ -215,16 +253,15 @@ class Viewer(QDialog):
 
         if self.mode == "normal":
             if event.buttons() == QtCore.Qt.RightButton:
-                posx = event.x()
-                posy = event.y()
-                smallest = 9999999
-                elem_id = None
-                for key, elem in self.elements_loader.elements.items():
-                    xscreen, yscreen = self.xy2screen(elem.x, elem.y)
-                    dist = np.sqrt((xscreen - posx) ** 2 + (yscreen - posy) ** 2)
-                    if dist < smallest:
-                        elem_id = key
-                        smallest = dist
+                # zoom into a cluster of nodes
+                cluster = self.elements_loader.find_cluster(self, event.x(), event.y())
+                if cluster is not None:
+                    self.set_xy(cluster[0], cluster[1])
+                    self.set_zoom(min(self.zoom + 2, config.max_zoom))
+                    self.update()
+                    return
+
+                elem_id = self.find_node(event.x(), event.y())
                 if elem_id:
                     self.elements_loader.selected_node = elem_id
                     self.update()
@@ -237,6 +274,40 @@ class Viewer(QDialog):
                 self.update()
                 self.change_mode("normal")
 
+    def select_node(self, node_id):
+        """ Select a node, show it in the ElementViewer and move the map to it.
+
+        Args:
+            node_id (int): id of the node
+        """
+        if node_id not in self.elements_loader.elements:
+            return
+        node = self.elements_loader.elements[node_id]
+        self.elements_loader.selected_node = node_id
+        self.element_viewer.set_node(node)
+        self.set_xy(node.x, node.y)
+        self.update()
+
+    def find_node(self, xscreen, yscreen):
+        """ Find the node which is the nearest to a position on the view.
+
+        Args:
+            xscreen (float): x coordinate on view
+            yscreen (float): y coordinate on view
+
+        Returns:
+            int: id of the nearest node or None if no node is loaded
+        """
+        smallest = 9999999
+        elem_id = None
+        for key, elem in self.elements_loader.elements.items():
+            x, y = self.xy2screen(elem.x, elem.y)
+            dist = np.sqrt((x - xscreen) ** 2 + (y - yscreen) ** 2)
+            if dist < smallest:
+                elem_id = key
+                smallest = dist
+        return elem_id
+
     def dragEnterEvent(self, event):
         """ This callback is fired when something is dragged above the view. It is shown to the user that this is
         accepted to allow dropping GPX files.
@@ -249,16 +320,57 @@ class Viewer(QDialog):
             event.acceptProposedAction()
 
     def dropEvent(self, event):
-        """ Event when something is dropped into the view. This is used to read GPX files.
+        """ Event when something is dropped into the view. This is used to read GPX files. Multiple files or files
+        dropped with the control key pressed are added to the heatmap.
 
         Args:
             event (Event): includes the dropping metadata
         """
+        urls = event.mimeData().urls()
+        if len(urls) > 1 or event.keyboardModifiers() & QtCore.Qt.ControlModifier:
+            heatmap = self.get_heatmap()
+            for url in urls:
+                heatmap.add_file(pathlib.Path(url.toLocalFile()))
+            return
+
         path = pathlib.Path(event.mimeData().urls()[0].toLocalFile())
-        self.layers.add_layer(GPXLoader(path), event.mimeData().urls()[0].toLocalFile())
+        gpx_loader = GPXLoader(path)
+        gpx_loader.progress.connect(self.update)
+        gpx_loader.failed.connect(self.show_gpx_error)
+        self.layers.add_layer(gpx_loader, event.mimeData().urls()[0].toLocalFile())
+        gpx_loader.start()
 
         self.update()
 
+    def get_heatmap(self):
+        """ Get the heatmap layer. The heatmap is shared with the other views, it is added to the layers of this view on
+        the first call.
+
+        Returns:
+            HeatmapLoader: heatmap of the GPX files
+        """
+        if self.heatmap is None:
+            self.heatmap = HeatmapLoader.get_shared_heatmap(self)
+            self.heatmap.progress.connect(self.update)
+            if len(self.heatmap.viewers) == 1:
+                # the errors are shown once and also after the view which created the heatmap was closed
+                self.heatmap.failed.connect(Viewer.show_gpx_error)
+            self.layers.add_layer(self.heatmap, "Heatmap")
+        return self.heatmap
+
+    @staticmethod
+    def show_gpx_error(message):
+        """ Callback when a GPX file could not be loaded.
+
+        Args:
+            message (str): error message
+        """
+        box = QMessageBox()
+        box.setWindowTitle("Error")
+        box.setText(f"The GPX file could not be loaded.\n\n{message}")
+        box.setIcon(QMessageBox.Icon.Warning)
+        box.exec()
+
     def keyPressEvent(self, event):
         """ Callback for keypress events. This is used to move the selected object around. this scales with the zoom
         level.
@@ -270,25 +382,30 @@ class Viewer(QDialog):
             node_id = self.parent.elements_loader.selected_node
             node = self.parent.elements_loader.elements[node_id]
             if event.key() == QtCore.Qt.Key_Right:
-                node.set_position(node.x + 1 / self.scale_x, node.y)
+                self.elements_loader.move_node(node_id, node.x + 1 / self.scale_x, node.y)
                 self.element_viewer.set_node(self.elements_loader.elements[node_id])
                 self.update()
             if event.key() == QtCore.Qt.Key_Left:
-                node.set_position(node.x - 1 / self.scale_x, node.y)
+                self.elements_loader.move_node(node_id, node.x - 1 / self.scale_x, node.y)
                 self.element_viewer.set_node(self.elements_loader.elements[node_id])
                 self.update()
             if event.key() == QtCore.Qt.Key_Up:
-                node.set_position(node.x, node.y + 1 / self.scale_y)
+                self.elements_loader.move_node(node_id, node.x, node.y + 1 / self.scale_y)
                 self.element_viewer.set_node(self.elements_loader.elements[node_id])
                 self.update()
             if event.key() == QtCore.Qt.Key_Down:
-                node.set_position(node.x, node.y - 1 / self.scale_y)
+                self.elements_loader.move_node(node_id, node.x, node.y - 1 / self.scale_y)
                 self.element_viewer.set_node(self.elements_loader.elements[node_id])
                 self.update()
 
+        # show the timing of the frames
+        if event.key() == QtCore.Qt.Key_F3:
+            self.frame_profiler.toggle()
+            self.update()
+
         # Zooming
         if event.key() == QtCore.Qt.Key_Plus:
-            if self.zoom < 19:
+            if self.zoom < config.max_zoom:
                 self.set_zoom(self.zoom + 1)
                 self.update()
         if event.key() == QtCore.Qt.Key_Minus:
@@ -307,13 +424,35 @@ class Viewer(QDialog):
 
         self.update()
 
+    def undo(self):
+        """ Undo the last edit of a node.
+        """
+        if self.elements_loader.undo():
+            self.refresh_element_viewer()
+            self.update()
+
+    def redo(self):
+        """ Redo the last undone edit of a node.
+        """
+        if self.elements_loader.redo():
+            self.refresh_element_viewer()
+            self.update()
+
+    def refresh_element_viewer(self):
+        """ Show the current state of the selected node in the ElementViewer.
+        """
+        node_id = self.elements_loader.selected_node
+        if node_id in self.elements_loader.elements:
+            self.element_viewer.set_node(self.elements_loader.elements[node_id])
+        else:
+            self.element_viewer.clear()
+
     def undo_changes(self):
-        """ Undo the changes of the nodes.
+        """ Undo all changes of the nodes. The nodes are reset locally without reloading them from the server.
         """
         self.parent.element_viewer.clear()
-        self.parent.elements_loader.clear()
+        self.parent.elements_loader.revert_changes()
         self.update()
-        self.load_elements()
 
     def change_mode(self, mode):
         """ Changes what happens when the mouse is clicked in the view. Also changes the cursor style.
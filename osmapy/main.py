@@ -1,14 +1,20 @@
 # -*- coding: utf-8 -*-
+from osmapy.utils.startup import profile  # first import to measure the whole start
+
+import argparse
 import ctypes
+import json
 import os
 import pathlib
+import re
 import sys
 from functools import partial
 from subprocess import call
 
 from PySide2 import QtCore
-from PySide2.QtGui import QIcon
-from PySide2.QtWidgets import (QApplication, QMainWindow, QToolBar, QDockWidget)
+from PySide2.QtGui import QIcon, QKeySequence
+from PySide2.QtWidgets import (QApplication, QMainWindow, QToolBar, QDockWidget, QMessageBox, QLineEdit,
+                               QSplitter)
 
 from osmapy.Changeset.Changeset import Changeset
 from osmapy.Changeset.ChangesetForm import ChangesetForm
@@ -16,8 +22,11 @@ from osmapy.ElementsLoader.ElementsLoader import ElementsLoader
 from osmapy.Viewer import Viewer
 from osmapy.Viewer.ElementViewer import ElementViewer
 from osmapy.Viewer.LayerManager import LayerManager
+from osmapy.Viewer.SearchPanel import SearchPanel
 from osmapy.utils import config
 
+profile.mark("imports")
+
 
 class Main(QMainWindow):
     """ MainWindow which contains all widgets of Osmapy.
@@ -35,6 +44,7 @@ class Main(QMainWindow):
         self.resize(config.config.window_size[0], config.config.window_size[1])
 
         self.elements_loader = ElementsLoader()
+        self.destroyed.connect(self.elements_loader.close)
 
         # Element Viewer as DockWidget
         self.element_viewer = ElementViewer(self)
@@ -52,19 +62,43 @@ class Main(QMainWindow):
         self.dock_layer_manager.setWidget(self.layer_manager)
         self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.dock_layer_manager)
 
+        # SearchPanel as DockWidget
+        self.search_panel = SearchPanel(self)
+        self.dock_search_panel = QDockWidget()
+        self.dock_search_panel.setWindowTitle("Search")
+        self.dock_search_panel.setFeatures(QDockWidget.DockWidgetFloatable | QDockWidget.DockWidgetMovable)
+        self.dock_search_panel.setWidget(self.search_panel)
+        self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.dock_search_panel)
+
         self.viewer = Viewer.Viewer(self)
-        self.setCentralWidget(self.viewer)
         self.viewer.setFocus()
         self.viewer.setFocusPolicy(QtCore.Qt.StrongFocus)
 
+        # a second view can be shown next to the map, see toggle_split_view()
+        self.splitter = QSplitter()
+        self.splitter.addWidget(self.viewer)
+        self.setCentralWidget(self.splitter)
+        self.split_viewer = None
+        self.dock_split_layer_manager = None
+
         self.changeset = Changeset(self)
         self.changset_form = ChangesetForm(self)
 
         self.toolbar = QToolBar()
         self.toolbar.addAction("Load Elements", self.viewer.load_elements)
-        self.toolbar.addAction("Undo Changes", self.viewer.undo_changes)
+        self.load_filter = QLineEdit(self.elements_loader.load_filter)
+        self.load_filter.setPlaceholderText("Load filter, e.g. amenity=bench")
+        self.load_filter.setToolTip("Load only nodes with these tags: key, !key, key=value or key=prefix*, "
+                                    "combined with &")
+        self.load_filter.setMaximumWidth(200)
+        self.load_filter.textChanged.connect(partial(setattr, self.elements_loader, "load_filter"))
+        self.toolbar.addWidget(self.load_filter)
+        self.toolbar.addAction("Undo", self.viewer.undo).setShortcut(QKeySequence.Undo)
+        self.toolbar.addAction("Redo", self.viewer.redo).setShortcut(QKeySequence.Redo)
+        self.toolbar.addAction("Revert Changes", self.viewer.undo_changes)
         self.toolbar.addAction("Create Node", partial(self.viewer.change_mode, "new_node"))
         self.toolbar.addAction("Upload Changes", self.changset_form.show)
+        self.toolbar.addAction("Split View", self.toggle_split_view)
         if os.name == "nt":
             self.toolbar.addAction("Open Configuration", partial(os.startfile, str(config.path_config)))
         elif sys.platform == "darwin":
@@ -75,15 +109,135 @@ class Main(QMainWindow):
 
         self.statusBar().showMessage("Welcome to Osmapy!")
 
+    def toggle_split_view(self):
+        """ Show or hide a second view next to the map, e.g. to compare aerial imagery with the map. The second view has
+        its own layers, but the views share the loaded elements and the tile loaders with their caches and workers.
+        """
+        if self.split_viewer is not None:
+            self.removeDockWidget(self.dock_split_layer_manager)
+            self.dock_split_layer_manager.deleteLater()
+            self.split_viewer.deleteLater()  # unsubscribes the view from the tile loaders
+            self.split_viewer = None
+            self.dock_split_layer_manager = None
+            return
+
+        layer_manager = LayerManager(self)
+        self.dock_split_layer_manager = QDockWidget()
+        self.dock_split_layer_manager.setWindowTitle("Layer Manager (Split View)")
+        self.dock_split_layer_manager.setFeatures(QDockWidget.DockWidgetFloatable | QDockWidget.DockWidgetMovable)
+        self.dock_split_layer_manager.setWidget(layer_manager)
+        self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.dock_split_layer_manager)
+
+        self.split_viewer = Viewer.Viewer(self, layer_manager, "split")
+        self.split_viewer.setFocusPolicy(QtCore.Qt.StrongFocus)
+        self.split_viewer.zoom = self.viewer.zoom
+        self.split_viewer.set_xy(self.viewer.x, self.viewer.y)
+        self.splitter.addWidget(self.split_viewer)
+
+
+def show_config_error(error):
+    """ Show a message box with the errors of the configuration file.
+
+    Args:
+        error (ConfigError): error which occurred while loading the configuration
+    """
+    box = QMessageBox()
+    if error.errors:
+        box.setWindowTitle("Configuration Error")
+        errdump = json.dumps(error.errors, sort_keys=True, indent=3)
+        errdump = re.sub('( *{\n)|(\s*\[)|(\s*\]\s*)|(\s*\})|(})|"', "", errdump)
+        box.setText(f"{error}\n\n"
+                    f"{errdump}\n\n"
+                    f"The path of the configuration file should be:\n"
+                    f"{config.path_config.resolve()}")
+    else:
+        box.setWindowTitle("Error")
+        box.setText(f"{error}\n"
+                    f"The path of the configuration file should be:\n"
+                    f"{config.path_config.resolve()}")
+    box.setIcon(QMessageBox.Icon.Warning)
+    box.exec_()
+
+
+def parse_args(args=None):
+    """ Parse the command line arguments.
+
+    Args:
+        args ([str]): arguments, the arguments of the process by default
+
+    Returns:
+        argparse.Namespace: parsed arguments
+    """
+    parser = argparse.ArgumentParser(prog="osmapy", description="Editor for OpenStreetMap nodes.")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print the duration of the phases of the start after the first frame")
+    parser.add_argument("--startup-budget", type=float, metavar="SECONDS",
+                        help="quit after the first frame and exit with status 1 if the start took longer")
+    parser.add_argument("--serve-tiles", type=int, metavar="PORT",
+                        help="run without window and serve the tile caches to other instances in the network")
+    parser.add_argument("--bind", default="0.0.0.0", metavar="ADDRESS",
+                        help="address the tile server listens on (default: all interfaces)")
+    return parser.parse_args(args)
+
+
+def first_frame(args, app):
+    """ Callback for the painted frames. On the first frame the start is reported and Osmapy quits if only the start
+    should be measured.
+
+    Args:
+        args (argparse.Namespace): parsed command line arguments
+        app (QApplication): application
+    """
+    if profile.finished():
+        return
+    profile.mark("first frame")
+    if args.profile_startup or args.startup_budget is not None:
+        print(profile.dumps())
+    if args.startup_budget is not None:
+        app.exit(0 if profile.total() <= args.startup_budget else 1)
+
+
+def serve_tiles(args):
+    """ Run the headless tile proxy until the process is interrupted.
+
+    Args:
+        args (argparse.Namespace): parsed command line arguments
+    """
+    from osmapy.TileLoader import TileServer
+
+    try:
+        config.config.load()
+    except config.ConfigError as error:
+        print(error, error.errors or "", file=sys.stderr)
+        sys.exit(1)
+    TileServer.serve((args.bind, args.serve_tiles))
+
 
 def main():
     # Staring point of Osmapy
+    args = parse_args()
+    if args.serve_tiles is not None:
+        serve_tiles(args)
+        return
     app = QApplication()
     app.setApplicationName("Osmapy")
+    profile.mark("application")
+    try:
+        config.config.load()
+    except config.ConfigError as error:
+        show_config_error(error)
+        sys.exit(1)
+    profile.mark("configuration")
     # show the icon in the windows taskbar
     if os.name == "nt":
         ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(u"osmapy")
-    main_window = Main()
+    try:
+        main_window = Main()
+    except config.ConfigError as error:
+        show_config_error(error)
+        sys.exit(1)
+    profile.mark("main window")
+    main_window.viewer.painted.connect(partial(first_frame, args, app))
     main_window.show()
     sys.exit(app.exec_())
 
@@ -1,55 +1,162 @@
 # -*- coding: utf-8 -*-
 
 """ A yaml configuration file is loaded and converted to a dict which allows the use of the dot operator. Some
-configurations are hardcoded here.
+configurations are hardcoded here. The file is loaded on the first access of the configuration. The validated result is
+cached, so the file is only parsed and validated again after it was modified. This module does not depend on Qt.
 """
 
+import hashlib
 import json
+import os
 import pathlib
-import re
-import sys
 
-import yaml
-from PySide2.QtWidgets import QMessageBox, QApplication
-from cerberus import Validator
 from easydict import EasyDict
 
 from osmapy.utils.config_schema import schema
 
 path_base = pathlib.Path(__file__).parent
 path_config = path_base / pathlib.Path("../config.txt")
+path_config_cache = path_base / pathlib.Path("../../cache/config.json")
 
-with open(path_config, "r") as file:
-    v = Validator(schema)
+
+class ConfigError(Exception):
+    """ Raised if the configuration file cannot be loaded or is not valid.
+    """
+
+    def __init__(self, message, errors=None):
+        """
+        Args:
+            message (str): description of the error
+            errors (dict): validation errors of Cerberus
+        """
+        super(ConfigError, self).__init__(message)
+        self.errors = errors
+
+
+def cache_key(path):
+    """ Key which changes if the configuration file or the schema is modified.
+
+    Args:
+        path (pathlib.Path): path of the configuration file
+
+    Returns:
+        list: modification time and size of the file and a hash of the schema
+    """
+    stat = path.stat()
+    schema_hash = hashlib.sha1(json.dumps(schema, sort_keys=True).encode()).hexdigest()
+    return [str(path.resolve()), stat.st_mtime_ns, stat.st_size, schema_hash]
+
+
+def load_config(path=path_config):
+    """ Load and validate the configuration file. A cached result is used if the file was not modified.
+
+    Args:
+        path (pathlib.Path): path of the configuration file
+
+    Returns:
+        EasyDict: configuration
+
+    Raises:
+        ConfigError: if the file cannot be loaded or is not valid
+    """
     try:
-        doc = yaml.safe_load(file)
+        key = cache_key(path)
+    except OSError as e:
+        raise ConfigError(f"The configuration file cannot be read: {e}")
+
+    doc = None
+    try:
+        with open(path_config_cache, "r") as json_file:
+            cached = json.load(json_file)
+        if cached["key"] == key:
+            doc = cached["config"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    if doc is None:
+        # parsing and validation are only needed after the file was modified
+        import yaml
+        from cerberus import Validator
+
+        try:
+            with open(path, "r") as file:
+                doc = yaml.safe_load(file)
+        except (OSError, yaml.YAMLError) as e:
+            raise ConfigError(f"Something went wrong while loading your config file: {e}")
+        v = Validator(schema)
         if not v.validate(doc, schema):
-            app = QApplication()
-            box = QMessageBox()
-            box.setWindowTitle("Configuration Error")
-            errdump = json.dumps(v.errors, sort_keys=True, indent=3)
-            errdump = re.sub('( *{\n)|(\s*\[)|(\s*\]\s*)|(\s*\})|(})|"', "", errdump)
-            box.setText(f"There are errors in your configuration file.\n\n"
-                        f"{errdump}\n\n"
-                        f"The path of the configuration file should be:\n"
-                        f"{path_config.resolve()}")
-            box.setIcon(QMessageBox.Icon.Warning)
-            box.show()
-            sys.exit(app.exec_())
-    except SystemExit:
-        exit()
-    except:
-        app = QApplication()
-        box = QMessageBox()
-        box.setWindowTitle("Error")
-        box.setText(f"Something went wrong while loading your config file.\n"
-                    f"The path of the configuration file should be:\n"
-                    f"{path_config.resolve()}")
-        box.setIcon(QMessageBox.Icon.Warning)
-        box.show()
-        sys.exit(app.exec_())
+            raise ConfigError("There are errors in your configuration file.", v.errors)
+
+        try:
+            path_config_cache.parent.mkdir(parents=True, exist_ok=True)
+            # the configuration can contain the password, so only the user may read the cache
+            descriptor = os.open(path_config_cache, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(descriptor, "w") as json_file:
+                os.chmod(path_config_cache, 0o600)  # the cache may have been created before with other permissions
+                json.dump({"key": key, "config": doc}, json_file)
+        except OSError:
+            pass  # without cache the file is validated again on the next start
 
     config = EasyDict(doc)
 
-config.image_size = 256  # tile size
-config.retry_time_tile = 4  # Wait 4 seconds before retry to load a slippy tile
+    config.image_size = 256  # tile size
+    config.max_zoom = 22  # Deepest zoom level of the view, tiles above the maximum zoom level of a source are scaled
+    config.retry_time_tile = 4  # Wait 4 seconds before retry to load a slippy tile
+    config.tile_memory_cache_size = 256  # Number of decoded slippy tiles kept in memory per layer
+    config.element_store_max_age = 60 * 60 * 24  # Load a stored area from the server again after 1 day
+    config.heatmap_max_zoom = 19  # Finest zoom level of the GPX heatmap
+    config.heatmap_saturation = 20  # Number of tracks per pixel with the strongest color in the GPX heatmap
+    config.changeset_max_elements = 10000  # Maximum number of elements in one changeset allowed by the OSM API
+    config.upload_chunk_size = 1000  # Number of elements uploaded with one diff upload
+    config.api_timeout = 120  # Seconds to wait for an answer of the OSM API
+    config.conflict_check_batch_size = 500  # Number of nodes requested at once when checking their versions
+    config.conflict_check_connections = 4  # Parallel requests when checking the versions of the nodes
+    config.journal_checkpoint_size = 500  # Save the edited nodes from the journal to the element store after 500 nodes
+    config.undo_limit = 1000  # Number of edits which can be undone
+    config.cluster_max_zoom = 15  # Deepest zoom level where many nodes are drawn as clusters
+    config.cluster_min_nodes = 1000  # Draw clusters if at least 1000 nodes are loaded
+    config.cluster_radius = 40  # Size of the clusters in pixels
+    config.duplicate_distance = 1.0  # Nodes closer than 1 metre are reported as duplicates
+    config.overpass_timeout = 25  # Seconds the Overpass API may spend on a filtered load
+    if not config.get("overpass_url"):
+        config.overpass_url = "https://overpass-api.de/api/interpreter"  # Overpass API for filtered loads
+    return config
+
+
+class LazyConfig:
+    """ Proxy for the configuration which loads it on the first access.
+    """
+
+    def __init__(self):
+        self._config = None
+
+    def load(self):
+        """ Load the configuration if this was not done yet.
+
+        Returns:
+            EasyDict: configuration
+
+        Raises:
+            ConfigError: if the file cannot be loaded or is not valid
+        """
+        if self._config is None:
+            self._config = load_config()
+        return self._config
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+    def __setattr__(self, name, value):
+        if name == "_config":
+            super(LazyConfig, self).__setattr__(name, value)
+        else:
+            setattr(self.load(), name, value)
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __contains__(self, key):
+        return key in self.load()
+
+
+config = LazyConfig()
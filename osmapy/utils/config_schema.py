@@ -35,6 +35,28 @@ schema = {
         'type': 'string',
         'nullable': True
     },
+    'node_styles': {
+        'required': False,
+        'type': 'list',
+        'nullable': True,
+        'schema': {
+            'type': 'string'
+        }
+    },
+    'frame_log': {
+        'required': False,
+        'type': 'boolean'
+    },
+    'overpass_url': {
+        'required': False,
+        'type': 'string',
+        'nullable': True
+    },
+    'load_filter': {
+        'required': False,
+        'type': 'string',
+        'nullable': True
+    },
 
     'slippy_tiles': {
         'required': True,
@@ -50,6 +72,11 @@ schema = {
                     'required': True,
                     'type': 'boolean',
                 },
+                'max_zoom': {
+                    'required': False,
+                    'type': 'integer',
+                    'min': 0
+                },
                 'urls': {
                     'required': True,
                     'type': 'list',
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+""" Accessors for the libraries which are not needed to show the map, e.g. to load elements or to upload changes. They
+are imported on the first use, so the start of Osmapy does not wait for them, and are kept afterwards.
+"""
+
+import importlib
+
+modules = dict()  # imported libraries with their names as keys
+
+
+def load(name):
+    """ Import a library on the first call.
+
+    Args:
+        name (str): name of the module
+
+    Returns:
+        module: imported module
+    """
+    module = modules.get(name)
+    if module is None:
+        module = modules[name] = importlib.import_module(name)
+    return module
+
+
+def etree():
+    """
+    Returns:
+        module: lxml.etree
+    """
+    return load("lxml.etree")
+
+
+def requests():
+    """
+    Returns:
+        module: requests
+    """
+    return load("requests")
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+""" Measurement of the start of Osmapy. The time is counted from the import of this module, which is the first import
+of the main module. Every phase of the start is marked with its end time, so the duration of every phase and the time to
+the first painted frame can be reported. This module only uses the standard library to not distort the measurement.
+"""
+
+import json
+import time
+
+
+class StartupProfile:
+    """ Record the end times of the phases of the start.
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.phases = []
+
+    def mark(self, phase):
+        """ Mark the end of a phase of the start.
+
+        Args:
+            phase (str): name of the phase
+        """
+        self.phases.append((phase, time.perf_counter()))
+
+    def finished(self):
+        """ Check if the first frame was painted.
+
+        Returns:
+            bool: the start is finished
+        """
+        return any(phase == "first frame" for phase, _ in self.phases)
+
+    def total(self):
+        """ Time from the start until the last marked phase.
+
+        Returns:
+            float: seconds
+        """
+        if not self.phases:
+            return 0.0
+        return self.phases[-1][1] - self.start_time
+
+    def report(self):
+        """ Duration of every phase of the start.
+
+        Returns:
+            dict: total time and the duration of every phase in seconds
+        """
+        durations = dict()
+        last_time = self.start_time
+        for phase, end_time in self.phases:
+            durations[phase] = round(end_time - last_time, 4)
+            last_time = end_time
+        return {"total": round(self.total(), 4), "phases": durations}
+
+    def dumps(self):
+        """ Report as a JSON string.
+
+        Returns:
+            str: JSON of the report
+        """
+        return json.dumps(self.report(), indent=2)
+
+
+profile = StartupProfile()
@@ -15,7 +15,6 @@ setuptools.setup(name="osmapy",
                      "easydict",
                      "lxml",
                      "requests",
-                     "gpxpy",
                      "dataclasses;python_version<'3.7'",
                      "cerberus"
                  ],